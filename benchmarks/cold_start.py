@@ -0,0 +1,58 @@
+# Measures how long JobFinder takes to start, i.e. to import everything a command needs before doing any work.
+# Every measurement runs in a fresh interpreter and the median of several runs is compared against the budget
+# documented in the README, exiting with an error when a command goes over it.
+#
+# Usage: python benchmarks/cold_start.py [runs]
+import os
+import sys
+import time
+import statistics
+import subprocess
+
+source_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+# Milliseconds, interpreter startup included
+budgets = {
+    'status': 150,
+    'build': 600,
+    'send': 300
+}
+
+# What each command imports before it starts working
+command_imports = {
+    'status': 'import JobFinder, Manifest, SendQueue',
+    'build': 'import JobFinder, GenerateCV',
+    'send': 'import JobFinder, GenerateEmail'
+}
+
+def measure(code, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=source_folder, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    baseline = measure('pass', runs)
+    print(f"Interpreter startup: {baseline:.0f} ms")
+    over_budget = []
+    for command, code in command_imports.items():
+        elapsed = measure(code, runs)
+        status = 'ok' if elapsed <= budgets[command] else 'OVER BUDGET'
+        print(f"{command:>8}: {elapsed:6.0f} ms (budget {budgets[command]} ms) {status}")
+        if elapsed > budgets[command]:
+            over_budget.append(command)
+    # Guards against a heavy import creeping back into the top of JobFinder.py
+    leaked = subprocess.run(
+        [sys.executable, '-c', "import sys, JobFinder; print(','.join(name for name in ('reportlab', 'pypdf', 'PIL', 'googleapiclient', 'jsonschema') if name in sys.modules))"],
+        cwd=source_folder, check=True, capture_output=True, text=True
+    ).stdout.strip()
+    if leaked:
+        print(f"JobFinder.py imports {leaked} at module load")
+        over_budget.append('imports')
+    sys.exit(1 if over_budget else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+# Micro-benchmark of the per-message overhead of sending through the Gmail API.
+# Compares building a new service for every email (the previous behaviour) against reusing a GmailBackend
+# and against batch requests, all against a local mock of the Gmail endpoint so only the client side cost is measured.
+#
+# Usage: python benchmarks/gmail_client.py [messages]
+import os
+import sys
+import json
+import time
+import base64
+import tempfile
+import threading
+
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.parser import BytesParser
+from email.policy import HTTP
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+from EmailBackends import GmailBackend
+from RateLimit import Backoff
+
+class MockGmailHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Answers in a single segment, otherwise delayed ACKs dominate the timings of kept-alive connections
+    disable_nagle_algorithm = True
+    connections = set()
+
+    # Every n-th message of a batch is rejected, to check results are mapped back to the right message
+    fail_every = 0
+    messages = 0
+    # The first attempt of every n-th message is answered with a 429, to check throttled messages are sent again
+    throttle_every = 0
+    throttled = set()
+
+    def do_POST(self):
+        MockGmailHandler.connections.add(self.client_address)
+        request = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path.startswith('/batch'):
+            self.answer(*self.answer_batch(request))
+        elif 'uploadType=resumable' in self.path:
+            # Starts a resumable upload session, the chunks are then PUT to the returned location
+            self.answer('application/json', b'', {'Location': f"http://{self.headers['Host']}/upload/session"})
+        elif self.should_throttle(self.path):
+            self.answer('application/json', json.dumps({'error': {'code': 429, 'message': 'Too many requests'}}).encode(), {'Retry-After': '0'}, status=429)
+        else:
+            self.answer('application/json', json.dumps({'id': 'mock-message', 'threadId': 'mock-thread'}).encode())
+
+    def should_throttle(self, key):
+        MockGmailHandler.messages += 1
+        if not self.throttle_every or MockGmailHandler.messages % self.throttle_every or key in MockGmailHandler.throttled:
+            return False
+        MockGmailHandler.throttled.add(key)
+        return True
+
+    def do_PUT(self):
+        MockGmailHandler.connections.add(self.client_address)
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        # Content-Range: bytes <first>-<last>/<total>
+        last, total = self.headers['Content-Range'].split('-')[1].split('/')
+        if int(last) + 1 < int(total):
+            self.answer('text/plain', b'', {'Range': f"bytes=0-{last}"}, status=308)
+        else:
+            self.answer('application/json', json.dumps({'id': 'mock-message', 'threadId': 'mock-thread'}).encode())
+
+    def answer(self, content_type, body, headers=None, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def answer_batch(self, request):
+        # Answers a multipart/mixed batch with one embedded HTTP response per embedded request
+        batch = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + request)
+        boundary = 'mock_batch_boundary'
+        parts = []
+        for part in batch.iter_parts():
+            content_id = part['Content-ID'].strip('<>')
+            if self.should_throttle(content_id.split('+')[-1]):
+                status, payload = '429 Too Many Requests', {'error': {'code': 429, 'message': 'Too many requests'}}
+            elif self.fail_every and MockGmailHandler.messages % self.fail_every == 0:
+                status, payload = '400 Bad Request', {'error': {'code': 400, 'message': 'Invalid to header'}}
+            else:
+                status, payload = '200 OK', {'id': f"mock-{content_id}", 'threadId': 'mock-thread'}
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n\r\n{json.dumps(payload)}\r\n"
+            )
+        return f"multipart/mixed; boundary={boundary}", (''.join(parts) + f"--{boundary}--\r\n").encode()
+
+    def log_message(self, *args):
+        pass
+
+def start_mock_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockGmailHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+def benchmark(name, send, messages, messages_per_call=1):
+    MockGmailHandler.connections.clear()
+    start = time.perf_counter()
+    for _ in range(messages // messages_per_call):
+        send()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {elapsed/messages*1000:8.2f} ms/message  {len(MockGmailHandler.connections):4d} connection(s)")
+    return elapsed / messages
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    server, endpoint = start_mock_server()
+    credentials = Credentials(token='mock-token')
+    backend = GmailBackend(credentials, api_endpoint=endpoint)
+
+    # A message with a 75 KB attachment, about the size of a generated CV
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as attachment:
+        attachment.write(os.urandom(75_000))
+    mime_message = MIMEMultipart()
+    mime_message['to'] = 'company@example.com'
+    mime_message['subject'] = 'Application'
+    mime_message.attach(MIMEText('<p>Hello</p>', 'html', 'utf-8'))
+    message_path = backend.encode(mime_message, [(attachment.name, 'curriculum.pdf')])
+    raw_message = {'raw': base64.urlsafe_b64encode(open(message_path, 'rb').read()).decode()}
+
+    def send_with_new_service():
+        service = build('gmail', 'v1', credentials=credentials, client_options={'api_endpoint': endpoint})
+        service.users().messages().send(userId='me', body=raw_message).execute()
+
+    print(f"Sending {messages} messages to a mock Gmail endpoint at {endpoint}")
+    before = benchmark('New service per message', send_with_new_service, messages)
+    after = benchmark('Shared GmailBackend', lambda: backend.send(message_path), messages)
+    print(f"Per-message overhead reduced by {before - after:.4f}s ({before/after:.1f}x faster)")
+
+    batch_messages = {str(index): message_path for index in range(messages)}
+    MockGmailHandler.fail_every = 7
+    MockGmailHandler.messages = 0
+    failures = []
+    def send_in_batches():
+        for results in backend.send_batches(batch_messages, batch_size=50):
+            failures.extend(request_id for request_id, (response, error) in results.items() if error)
+    benchmark('Batch requests of 50', send_in_batches, messages, messages)
+    print(f"{len(failures)} rejected message(s) mapped back to their ids: {sorted(failures, key=int)}")
+
+    # Throttled messages are sent again after a jittered backoff, the other results are kept
+    MockGmailHandler.fail_every = 0
+    MockGmailHandler.throttle_every = 10
+    MockGmailHandler.messages = 0
+    backoff = Backoff(retries=3, base=0.01, maximum=0.05)
+    sent = []
+    def send_throttled_batches():
+        for results in backend.send_batches(batch_messages, batch_size=50, backoff=backoff):
+            sent.extend(request_id for request_id, (response, error) in results.items() if not error)
+    benchmark('Throttled batches of 50', send_throttled_batches, messages, messages)
+    print(f"{len(sent)}/{messages} message(s) sent after {len(MockGmailHandler.throttled)} throttled attempt(s)")
+    MockGmailHandler.throttled.clear()
+    benchmark('Throttled single sends', lambda: backoff.call(backend.send, message_path), messages // 10)
+    MockGmailHandler.throttle_every = 0
+
+    # Messages bigger than the upload chunk size go through a resumable upload
+    chunked_backend = GmailBackend(credentials, api_endpoint=endpoint, upload_chunk_size=256*1024)
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as large_attachment:
+        large_attachment.write(os.urandom(2_000_000))
+    large_message_path = chunked_backend.encode(mime_message, [(large_attachment.name, 'curriculum.pdf')])
+    benchmark('Resumable upload of 2 MB', lambda: chunked_backend.send(large_message_path), max(1, messages // 20))
+
+    for path in (attachment.name, large_attachment.name):
+        os.remove(path)
+    backend.release_payload(message_path)
+    chunked_backend.release_payload(large_message_path)
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
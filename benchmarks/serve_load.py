@@ -0,0 +1,122 @@
+# Load test of the 'serve' command. Starts the service on synthetic data and reports the p50/p99 latency of:
+#   cold: the first render after the service started, before any cache is warm
+#   miss: renders of companies not rendered before, with the templates and the base layout already warm
+#   hit:  the same requests again, answered from the result cache
+#   concurrent: a mix of misses and hits sent by several clients at once
+#
+# Usage: python benchmarks/serve_load.py [--requests 200] [--clients 8] [--workers 1]
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import statistics
+import urllib.error
+import urllib.request
+
+from concurrent.futures import ThreadPoolExecutor
+
+benchmark_folder = os.path.dirname(os.path.abspath(__file__))
+source_folder = os.path.join(benchmark_folder, '..', 'src')
+sys.path.insert(0, source_folder)
+sys.path.insert(0, benchmark_folder)
+
+from suite import create_curriculum
+
+def get_free_port():
+    with socket.socket() as server:
+        server.bind(('127.0.0.1', 0))
+        return server.getsockname()[1]
+
+def post(url, payload):
+    start = time.perf_counter()
+    request = urllib.request.Request(url, data=payload, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            return time.perf_counter() - start, response.headers.get('X-Cache')
+    except urllib.error.HTTPError as error:
+        # A busy service turns requests away instead of queueing them, they are counted apart
+        if error.code != 503:
+            raise
+        return time.perf_counter() - start, 'BUSY'
+
+def wait_until_ready(url, process):
+    for _ in range(300):
+        if process.poll() is not None:
+            raise RuntimeError('The service exited before accepting requests.')
+        try:
+            with urllib.request.urlopen(url) as response:
+                return json.load(response)
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('The service did not start.')
+
+def summarize(name, timings):
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, round(0.99 * (len(timings) - 1)))]
+    print(f"{name:<12}{len(timings):>10}{statistics.median(timings) * 1000:>12.1f}{p99 * 1000:>12.1f}")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='JobFinder serve load test')
+    parser.add_argument('--requests', type=int, default=200, help='Distinct companies rendered (default: 200)')
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent clients of the last phase (default: 8)')
+    parser.add_argument('--workers', type=int, default=1, help="Render workers of the service (default: 1)")
+    parser.add_argument('--content', default='large', help='Content size of the synthetic curriculum: small or large (default: large)')
+    return parser.parse_args()
+
+def main():
+    arguments = parse_arguments()
+    port = get_free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory(prefix='jobfinder_serve_load_') as folder:
+        working_folder = os.getcwd()
+        os.chdir(folder)
+        try:
+            # The logos of twice the requests, the second half is only used by the concurrent phase
+            data = create_curriculum(arguments.requests * 2, arguments.content)
+            # The service only reads avatars from its avatars folder
+            os.makedirs('avatars', exist_ok=True)
+            os.replace(data['avatar'], os.path.join('avatars', data['avatar']))
+        finally:
+            os.chdir(working_folder)
+        companies = data.pop('companies')
+        payloads = [json.dumps({'curriculum': data, 'company': company}).encode('utf-8') for company in companies]
+
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(source_folder, 'JobFinder.py'), 'serve', '--port', str(port), '--workers', str(arguments.workers), '--cache-size', str(len(payloads))],
+            cwd=folder, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_until_ready(f"{base_url}/health", process)
+            url = f"{base_url}/render"
+            cold, _ = post(url, payloads[0])
+            misses = [post(url, payload)[0] for payload in payloads[1:arguments.requests]]
+            hits = [post(url, payload)[0] for payload in payloads[:arguments.requests]]
+            # Half of the concurrent requests were already rendered, the other half weren't
+            mixed = payloads[arguments.requests // 2:arguments.requests + arguments.requests // 2]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=arguments.clients) as clients:
+                answers = list(clients.map(lambda payload: post(url, payload), mixed))
+            elapsed = time.perf_counter() - start
+            concurrent = [timing for timing, cache_state in answers if cache_state != 'BUSY']
+            rejected = len(answers) - len(concurrent)
+            with urllib.request.urlopen(f"{base_url}/health") as response:
+                stats = json.load(response)
+        finally:
+            process.terminate()
+            process.wait()
+
+    print(f"{'phase':<12}{'requests':>10}{'p50 (ms)':>12}{'p99 (ms)':>12}")
+    summarize('cold', [cold])
+    summarize('miss', misses)
+    summarize('hit', hits)
+    summarize('concurrent', concurrent)
+    print(f"Concurrent throughput: {len(concurrent) / elapsed:.1f} requests/s with {arguments.clients} clients and {arguments.workers} worker(s), {rejected} rejected as busy (503)")
+    print(f"Service cache: {stats['cache']['hits']} hits, {stats['cache']['misses']} misses")
+
+if __name__ == '__main__':
+    main()
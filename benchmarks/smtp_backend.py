@@ -0,0 +1,72 @@
+# Micro-benchmark of the SMTP backend against a local aiosmtpd server standing in for the real one.
+# Compares opening a new SMTP connection for every email against reusing the SmtpBackend's connection pool.
+#
+# Usage: python benchmarks/smtp_backend.py [messages]   (requires: pip install aiosmtpd)
+import os
+import sys
+import time
+import socket
+import smtplib
+
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from aiosmtpd.controller import Controller
+
+from EmailBackends import SmtpBackend
+
+class CountingHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return '250 Message accepted for delivery'
+
+def build_message(index):
+    message = MIMEMultipart()
+    message['to'] = f"company{index}@example.com"
+    message['subject'] = f"Application {index}"
+    message.attach(MIMEText('<p>Hello</p>\n' * 1000, 'html'))
+    return message
+
+def get_free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    handler = CountingHandler()
+    host, port = '127.0.0.1', get_free_port()
+    controller = Controller(handler, hostname=host, port=port)
+    controller.start()
+    print(f"Sending {messages} messages to a local SMTP server at {host}:{port}")
+
+    backend = SmtpBackend(host, port, sender='me@example.com', security='none', pool_size=2)
+    payloads = [backend.encode(build_message(index)) for index in range(messages)]
+
+    start = time.perf_counter()
+    for _, recipients, message_path in payloads:
+        # Reads the spooled message like the pooled backend does, so both send the same bytes
+        with smtplib.SMTP(host, port) as connection, open(message_path, 'rb') as message:
+            connection.sendmail('me@example.com', recipients, message.read())
+    before = (time.perf_counter() - start) / messages
+    print(f"{'New connection per message':<28} {before*1000:8.2f} ms/message")
+
+    start = time.perf_counter()
+    for payload in payloads:
+        backend.send(payload)
+    after = (time.perf_counter() - start) / messages
+    print(f"{'Pooled SmtpBackend':<28} {after*1000:8.2f} ms/message  {backend.created} connection(s)")
+    print(f"Per-message overhead reduced by {before - after:.4f}s ({before/after:.1f}x faster), {handler.received} messages received")
+
+    for payload in payloads:
+        backend.release_payload(payload)
+    backend.close()
+    controller.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+# Benchmark suite for CV rendering and email assembly.
+# Generates synthetic curricula with 1, 100 and 1,000 companies (and small and large experience/project sections)
+# in a temporary folder, times every stage, and reports throughput, peak memory and PDF sizes. Results are saved
+# as JSON named after the current commit, so a run can be compared against any previous one.
+#
+# Usage: python benchmarks/suite.py [--sizes 1,100,1000] [--repeat 3] [--compare benchmarks/results/<file>.json]
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+benchmark_folder = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchmark_folder, '..', 'src'))
+
+from PIL import Image as PILImage
+
+import templates.Base as template
+from GenerateCV import generate_cv_for_companies
+from GenerateEmail import generate_email_body, send_gmail
+from EmailTemplate import EmailTemplate
+from EmailBackends import GmailBackend
+from Tailoring import KeywordIndex
+
+results_folder = os.path.join(benchmark_folder, 'results')
+
+# Amount of experience entries, projects and paragraphs per content size
+content_sizes = {
+    'small': {'experience': 2, 'projects': 2, 'paragraphs': 1},
+    'large': {'experience': 12, 'projects': 10, 'paragraphs': 4}
+}
+
+words = ('scalable', 'distributed', 'python', 'cloud', 'pipeline', 'team', 'latency', 'delivered', 'platform', 'design', 'api', 'migration')
+
+class MockGmailBackend(GmailBackend):
+    # Assembles and spools every message like the real backend, but the send only reads the message file back
+    def __init__(self):
+        self.sent = 0
+        self.sent_bytes = 0
+
+    def send(self, message_path):
+        self.sent += 1
+        self.sent_bytes += os.path.getsize(message_path)
+        return {'id': str(self.sent)}
+
+def get_sentence(generator, length):
+    return ' '.join(generator.choice(words) for _ in range(length)).capitalize() + '.'
+
+def create_curriculum(companies, content_size, seed=0):
+    """
+    Builds a synthetic curriculum.json data dict, and the logos and avatar it points to, in the current folder.
+
+    Parameters:
+    companies (int): The number of target companies.
+    content_size (str): One of the content_sizes keys.
+    seed (int): Seed of the generated text, so every run renders the same content.
+
+    Returns:
+    dict: The curriculum data.
+    """
+    generator = random.Random(seed)
+    size = content_sizes[content_size]
+    os.makedirs('logos', exist_ok=True)
+    if not os.path.exists('avatar.jpg'):
+        PILImage.new('RGB', (800, 800), (90, 120, 160)).save('avatar.jpg', quality=90)
+    company_entries = []
+    for index in range(companies):
+        logo = f"Company{index:05d}.png"
+        logo_path = os.path.join('logos', logo)
+        if not os.path.exists(logo_path):
+            color = (generator.randrange(256), generator.randrange(256), generator.randrange(256), 255)
+            PILImage.new('RGBA', (1024, 512), color).save(logo_path)
+        company_entries.append({'logo': logo, 'email': f"jobs{index}@example.com", 'position': 'Software Engineer'})
+    return {
+        'minimumInterval': 30,
+        'maximumInterval': 45,
+        'message': {
+            'opening': ["<p>Greetings {company} Team,</p>"],
+            'constant': ["<p>Noticed you have a vacancy for {position}.</p>"],
+            'variable': [f"<p>{get_sentence(generator, 30)} {{company}}.</p>" for _ in range(5)],
+            'ending': ["<p>Best regards,<br>{name}</p>"]
+        },
+        'companies': company_entries,
+        'avatar': 'avatar.jpg',
+        'name': 'Jane Doe',
+        'title': 'Software Engineer',
+        'about': [get_sentence(generator, 40) for _ in range(size['paragraphs'])],
+        'contact': {
+            'address': '1 Main Street',
+            'phone': '+1 555 0100',
+            'email': 'jane.doe@example.com',
+            'linkedin': 'https://www.linkedin.com/in/janedoe',
+            'github': 'https://github.com/janedoe'
+        },
+        'experience': [{
+            'title': 'Software Engineer',
+            'team': f"Team {index}",
+            'company': f"Employer {index}",
+            'date': '2020 - 2022',
+            'sectors': ['Finance', 'Retail'],
+            'technologies': ['Python', 'PostgreSQL', 'Kubernetes']
+        } for index in range(size['experience'])],
+        'education': [{'degree': 'BSc Computer Science', 'institution': 'University', 'date': '2015'}],
+        'certificates': [{'name': 'Cloud Architect', 'authority': 'Vendor', 'date': '2021'}],
+        'projects': [{
+            'title': f"Project {index}",
+            'description': [get_sentence(generator, 25) for _ in range(size['paragraphs'])]
+        } for index in range(size['projects'])],
+        'skills': {'Technical': {'Python': 5, 'SQL': 4}, 'Soft': {'Communication': 4}},
+        'languages': {'English': 5}
+    }
+
+def measure(function, repeat):
+    """
+    Runs a function once under tracemalloc for its peak memory, which also warms up the caches (e.g. the resized
+    logos), and then times it.
+
+    Parameters:
+    function (callable): The code to benchmark, called without arguments.
+    repeat (int): The number of timed runs.
+
+    Returns:
+    dict: The median 'seconds' of the timed runs, the 'peakMemory' in bytes and the 'result' of the last run.
+    """
+    tracemalloc.start()
+    with redirect_stdout(io.StringIO()):
+        function()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            result = function()
+        timings.append(time.perf_counter() - start)
+    return {'seconds': statistics.median(timings), 'peakMemory': peak_memory, 'result': result}
+
+def get_folder_size(folder):
+    return sum(entry.stat().st_size for entry in os.scandir(folder) if entry.is_file() and entry.name.endswith('.pdf'))
+
+def benchmark_single_render(content_size, repeat, output_profile=template.defaultOutputProfile):
+    data = create_curriculum(1, content_size)
+    logo_path = os.path.join('logos', data['companies'][0]['logo'])
+    measured = measure(lambda: template.generate_pdf_from_json(os.path.join('single', 'curriculum.pdf'), data, logo_path, output_profile), repeat)
+    return {
+        'seconds': measured['seconds'],
+        'throughput': 1 / measured['seconds'],
+        'unit': 'CVs/s',
+        'peakMemory': measured['peakMemory'],
+        'pdfSize': os.path.getsize(measured['result'])
+    }
+
+def benchmark_companies(companies, content_size, repeat):
+    data = create_curriculum(companies, content_size)
+    pdf_folder = f"output_{companies}_{content_size}"
+    # Forced, otherwise every run after the first one would only check the manifest
+    measured = measure(lambda: generate_cv_for_companies(data, pdf_folder, 1, True), repeat)
+    rendered = len(measured['result'][0])
+    return {
+        'seconds': measured['seconds'],
+        'throughput': rendered / measured['seconds'],
+        'unit': 'CVs/s',
+        'peakMemory': measured['peakMemory'],
+        'pdfSize': round(get_folder_size(pdf_folder) / rendered)
+    }
+
+def benchmark_transparent_image(repeat):
+    create_curriculum(1, 'small')
+    logo_path = os.path.join('logos', 'Company00000.png')
+    def create():
+        # Cleared every time, a cached call would only measure the lru_cache lookup
+        template.create_transparent_image.cache_clear()
+        return template.create_transparent_image(logo_path, 0.1)
+    measured = measure(create, repeat)
+    return {'seconds': measured['seconds'], 'throughput': 1 / measured['seconds'], 'unit': 'images/s', 'peakMemory': measured['peakMemory']}
+
+def benchmark_tailoring(companies, repeat):
+    data = create_curriculum(companies, 'large')
+    generator = random.Random(1)
+    job_descriptions = [get_sentence(generator, 120) for _ in range(companies)]
+    def tailor():
+        # The index is built once per run, as the CV generator does
+        index = KeywordIndex(data)
+        for job_description in job_descriptions:
+            index.tailor(job_description, {'maxProjects': 5})
+    measured = measure(tailor, repeat)
+    return {'seconds': measured['seconds'], 'throughput': companies / measured['seconds'], 'unit': 'companies/s', 'peakMemory': measured['peakMemory']}
+
+def benchmark_email_bodies(companies, repeat, wrapper=False):
+    data = create_curriculum(companies, 'small')
+    # Compiled outside of the timed runs, as campaigns do, so only the rendering is timed
+    email_template = EmailTemplate(data)
+    def generate():
+        for company in data['companies']:
+            if wrapper:
+                generate_email_body(os.path.splitext(company['logo'])[0], company['position'], data)
+            else:
+                email_template.render(os.path.splitext(company['logo'])[0], company['position'])
+    measured = measure(generate, repeat)
+    return {'seconds': measured['seconds'], 'throughput': companies / measured['seconds'], 'unit': 'bodies/s', 'peakMemory': measured['peakMemory']}
+
+def benchmark_mime_assembly(companies, repeat):
+    data = create_curriculum(companies, 'small')
+    # One real CV shared as the attachment of every email
+    with redirect_stdout(io.StringIO()):
+        pdf_path = template.generate_pdf_from_json(os.path.join('single', 'attachment.pdf'), data)
+    email_body = generate_email_body('Company', 'Software Engineer', data)
+    backend = MockGmailBackend()
+    def assemble():
+        for company in data['companies']:
+            send_gmail(os.path.splitext(company['logo'])[0], company['position'], company['email'], pdf_path, 'curriculum.pdf', email_body, None, backend)
+    measured = measure(assemble, repeat)
+    return {
+        'seconds': measured['seconds'],
+        'throughput': companies / measured['seconds'],
+        'unit': 'messages/s',
+        'peakMemory': measured['peakMemory'],
+        'messageSize': round(backend.sent_bytes / backend.sent)
+    }
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=benchmark_folder, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def print_results(results, previous=None):
+    print(f"{'benchmark':<40}{'seconds':>10}{'throughput':>24}{'peak memory':>14}{'pdf size':>12}{'change':>10}")
+    for name, result in results.items():
+        change = ''
+        if previous and name in previous:
+            change = f"{(result['seconds'] / previous[name]['seconds'] - 1) * 100:+.1f}%"
+        pdf_size = f"{result['pdfSize'] / 1024:.0f} KB" if 'pdfSize' in result else ''
+        throughput = f"{result['throughput']:.1f} {result['unit']}"
+        print(f"{name:<40}{result['seconds']:>10.3f}{throughput:>24}{result['peakMemory'] / 1024 / 1024:>11.1f} MB{pdf_size:>12}{change:>10}")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='JobFinder benchmark suite')
+    parser.add_argument('--sizes', default='1,100,1000', help='Comma separated amounts of companies (default: 1,100,1000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per benchmark, the median is reported (default: 3)')
+    parser.add_argument('--compare', help='Results file of a previous run to compare against')
+    parser.add_argument('--output', default=results_folder, help='Folder the results are saved to')
+    return parser.parse_args()
+
+def main():
+    arguments = parse_arguments()
+    sizes = [int(size) for size in arguments.sizes.split(',')]
+    output = os.path.abspath(arguments.output)
+    previous = None
+    if arguments.compare:
+        with open(arguments.compare, 'r', encoding='utf-8') as file:
+            previous = json.load(file)['results']
+
+    results = {}
+    working_folder = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='jobfinder_benchmark_') as folder:
+        # The CV generator reads logos and writes its caches relative to the working folder
+        os.chdir(folder)
+        try:
+            for content_size in content_sizes:
+                results[f"generate_pdf_from_json[{content_size}]"] = benchmark_single_render(content_size, arguments.repeat)
+                # Tracks the attachment size saved by the compact profile
+                results[f"generate_pdf_from_json[{content_size},compact]"] = benchmark_single_render(content_size, arguments.repeat, 'compact')
+            results['create_transparent_image'] = benchmark_transparent_image(arguments.repeat)
+            for companies in sizes:
+                # The biggest lists are only timed once, a single run already renders thousands of pages
+                repeat = 1 if companies >= 1000 else arguments.repeat
+                for content_size in content_sizes:
+                    results[f"generate_cv_for_companies[{companies},{content_size}]"] = benchmark_companies(companies, content_size, repeat)
+                results[f"tailor[{companies}]"] = benchmark_tailoring(companies, arguments.repeat)
+                results[f"generate_email_body[{companies}]"] = benchmark_email_bodies(companies, arguments.repeat)
+                # The single email helper, which looks its compiled template up on every call
+                results[f"generate_email_body[{companies},wrapper]"] = benchmark_email_bodies(companies, arguments.repeat, wrapper=True)
+                results[f"send_gmail_mime[{companies}]"] = benchmark_mime_assembly(companies, repeat)
+        finally:
+            os.chdir(working_folder)
+
+    print_results(results, previous)
+    commit = get_commit()
+    os.makedirs(output, exist_ok=True)
+    results_path = os.path.join(output, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{commit}.json")
+    with open(results_path, 'w', encoding='utf-8') as file:
+        json.dump({
+            'commit': commit,
+            'createdAt': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sizes': sizes,
+            'results': results
+        }, file, indent=4)
+    print(f"Results saved to {results_path}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# Compares the CPU time of a CV render with a cold template (styles rebuilt and every paragraph parsed again, as
+# before the template was reused) against a warm one (styles and parsed paragraphs reused from previous renders).
+# Only the story and layout are measured, the watermark is left out so the numbers aren't dominated by the logo.
+#
+# Usage: python benchmarks/template_cache.py [renders] [content size: small|large]
+import io
+import os
+import sys
+import statistics
+import tempfile
+import time
+
+benchmark_folder = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchmark_folder, '..', 'src'))
+sys.path.insert(0, benchmark_folder)
+
+import templates.Base as template
+from suite import create_curriculum
+
+def render(data):
+    start = time.process_time()
+    template.build_curriculum(io.BytesIO(), data)
+    return (time.process_time() - start) * 1000
+
+def measure(data, renders, cold):
+    timings = []
+    for _ in range(renders):
+        if cold:
+            template.get_template.cache_clear()
+            template.get_styles.cache_clear()
+            template.CurriculumTemplate.paragraph_fragments.clear()
+        timings.append(render(data))
+    return statistics.median(timings)
+
+def main():
+    renders = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    content_size = sys.argv[2] if len(sys.argv) > 2 else 'large'
+    working_folder = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='jobfinder_template_') as folder:
+        os.chdir(folder)
+        try:
+            data = create_curriculum(1, content_size)
+            # Warms up the avatar cache and reportlab's own font caches, so only the template is compared
+            render(data)
+            cold = measure(data, renders, True)
+            warm = measure(data, renders, False)
+        finally:
+            os.chdir(working_folder)
+    print(f"Cold template: {cold:.2f} ms CPU per render")
+    print(f"Warm template: {warm:.2f} ms CPU per render ({(1 - warm / cold) * 100:.0f}% less)")
+
+if __name__ == '__main__':
+    main()
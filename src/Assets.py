@@ -0,0 +1,69 @@
+import os
+import hashlib
+import Metrics
+from functools import lru_cache
+
+# Folder holding the images already resized to the resolution they are printed at
+asset_folder = os.path.join('cache', 'assets')
+
+@lru_cache(maxsize=256)
+def hash_file(file_path, modified_time, file_size):
+    # The modification time and size are part of the key so an edited file is hashed again
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def get_file_hash(file_path):
+    stat = os.stat(file_path)
+    return hash_file(os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+def get_cached_image(image_path, draw_width, draw_height, dpi=150, quality=85):
+    """
+    Fetches a copy of the image resized and recompressed for the size it is drawn at.
+
+    Parameters:
+    image_path (str): The path to the source image.
+    draw_width (float): The width the image is drawn at, in points.
+    draw_height (float): The height the image is drawn at, in points.
+    dpi (int): The resolution the image is printed at.
+    quality (int): The JPEG quality photos are recompressed with.
+
+    Returns:
+    str: The path to the cached image, or the source image when it is already small enough.
+    """
+    # Pillow and tempfile are only needed when rendering, the manifest only uses the hashing helpers of this module
+    import tempfile
+    from PIL import Image as PILImage
+
+    target_width = max(1, round(draw_width * dpi / 72))
+    target_height = max(1, round(draw_height * dpi / 72))
+    with Metrics.span('asset_load'), PILImage.open(image_path) as image:
+        if image.width <= target_width and image.height <= target_height:
+            return image_path
+        has_alpha = image.mode in ('RGBA', 'LA', 'P')
+        # Photos are keyed by quality too, the same size can be cached for several output profiles
+        extension = '.png' if has_alpha else f"_q{quality}.jpg"
+        cached_path = os.path.join(asset_folder, f"{get_file_hash(image_path)}_{target_width}x{target_height}{extension}")
+        if os.path.exists(cached_path):
+            Metrics.increment('asset_cache_hits')
+            return cached_path
+
+        Metrics.increment('asset_cache_misses')
+        image = image.convert('RGBA' if has_alpha else 'RGB').resize((target_width, target_height), PILImage.LANCZOS)
+        os.makedirs(asset_folder, exist_ok=True)
+        # Written under a unique temporary name first so parallel renders, in other processes or threads, never read
+        # nor write over a half written file
+        file_descriptor, temp_path = tempfile.mkstemp(suffix='.tmp', dir=asset_folder)
+        try:
+            with os.fdopen(file_descriptor, 'wb') as temp_file:
+                if has_alpha:
+                    image.save(temp_file, 'PNG', optimize=True)
+                else:
+                    image.save(temp_file, 'JPEG', quality=quality, optimize=True, progressive=True)
+            os.replace(temp_path, cached_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+    return cached_path
@@ -0,0 +1,123 @@
+import os
+import csv
+import json
+import zlib
+import sqlite3
+
+import Metrics
+
+from Validation import get_company_errors
+
+# Table read when a SQLite company source doesn't name one
+default_table = 'companies'
+
+def parse_shard(shard):
+    """
+    Parses a '--shard i/n' value, i being 1 based.
+
+    Parameters:
+    shard (str): The shard, e.g. '2/4' for the second of four machines.
+
+    Returns:
+    tuple: The (index, count) of the shard, index being 0 based.
+    """
+    try:
+        index, count = (int(part) for part in shard.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{shard}', expected i/n (e.g. 1/4).") from None
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{shard}', i must be between 1 and n.")
+    return index - 1, count
+
+def get_company_name(company):
+    company_name, company_logo_extension = os.path.splitext(company['logo'])
+    return company_name
+
+def in_shard(company_name, shard):
+    # Hashing the name instead of using the row number keeps every company on the same machine when the list is reordered or grows
+    if not shard:
+        return True
+    index, count = shard
+    return zlib.crc32(company_name.encode('utf-8')) % count == index
+
+def get_source_settings(company_source):
+    if isinstance(company_source, str):
+        return company_source, default_table
+    return company_source['path'], company_source.get('table', default_table)
+
+def read_json_lines(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        for line_number, line in enumerate(file, 1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError as error:
+                    yield line_number, error
+
+def read_csv(path):
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        # Line 1 holds the column names
+        for line_number, row in enumerate(csv.DictReader(file), 2):
+            # Empty cells are left out, so a missing value is reported as such instead of being used as an empty string
+            yield line_number, {column: value for column, value in row.items() if column and value not in (None, '')}
+
+def read_sqlite(path, table):
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    connection.row_factory = sqlite3.Row
+    try:
+        # The cursor fetches the rows as they are iterated, the table is never loaded as a whole
+        cursor = connection.execute(f'SELECT * FROM "{table}"')
+        for row_number, row in enumerate(cursor, 1):
+            yield row_number, {column: row[column] for column in row.keys() if row[column] is not None}
+    finally:
+        connection.close()
+
+def read_rows(company_source):
+    path, table = get_source_settings(company_source)
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.jsonl', '.ndjson'):
+        return read_json_lines(path)
+    if extension == '.csv':
+        return read_csv(path)
+    if extension in ('.db', '.sqlite', '.sqlite3'):
+        return read_sqlite(path, table)
+    raise ValueError(f"Unsupported company source '{path}', use a .jsonl, .csv or SQLite (.db, .sqlite) file.")
+
+def iter_companies(data, shard=None, report=True):
+    """
+    Streams the target companies, from the 'companySource' file when there is one or from the inline 'companies' array.
+
+    Rows are validated one at a time, invalid ones are reported and skipped, so a single bad row never stops a
+    long campaign and the list is never held in memory as a whole. Every call reads the source again.
+
+    Parameters:
+    data (dict): The curriculum data.
+    shard (tuple): The (index, count) returned by parse_shard, only the companies of that shard are yielded.
+    report (bool): Whether invalid rows are printed, so they are only reported once by callers reading the source several times.
+
+    Yields:
+    dict: The company entries, with at least 'logo', 'email' and 'position'.
+    """
+    company_source = data.get('companySource')
+    if not company_source:
+        for company in data.get('companies', []):
+            if in_shard(get_company_name(company), shard):
+                yield company
+        return
+
+    source_path, _ = get_source_settings(company_source)
+    for row_number, company in read_rows(company_source):
+        # Rows of other shards are skipped before being validated, rows without a usable logo belong to the first shard
+        if isinstance(company, dict) and isinstance(company.get('logo'), str):
+            other_shard = not in_shard(get_company_name(company), shard)
+        else:
+            other_shard = bool(shard) and shard[0] != 0
+        if other_shard:
+            continue
+        errors = [str(company)] if isinstance(company, Exception) else get_company_errors(company)
+        if errors:
+            if report:
+                print(f"<- MAIN -> Skipping row {row_number} of '{source_path}': {'; '.join(errors)}")
+                Metrics.increment('company_rows_invalid')
+            continue
+        yield company
@@ -1,8 +1,8 @@
 # Install all necessary requirements on your environment
 pip install -r requirements.txt
 
-# Run PyInstaller to create the executable
-pyinstaller --onefile --icon=img/jobfinder-logo.ico --distpath .. JobFinder.py
+# Run PyInstaller to create the executable, bundling every template since they are only imported once picked
+pyinstaller --onefile --icon=img/jobfinder-logo.ico --collect-submodules templates --distpath .. JobFinder.py
 
 # Check if the .spec file exists and delete it
 if (Test-Path "JobFinder.spec") {
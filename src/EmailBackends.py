@@ -0,0 +1,340 @@
+import os
+import ssl
+import time
+import queue
+import smtplib
+import threading
+import Metrics
+
+from itertools import islice
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, urlunparse
+from email.utils import formatdate, getaddresses, make_msgid
+
+from RateLimit import RateLimiter, is_quota_error
+from StreamingMime import chunk_size, write_message, read_raw_message, remove_message
+
+class EmailBackend:
+    """
+    Interface every email transport implements.
+
+    encode turns a MIME message and its attachments into whatever the transport sends, so it can be done ahead of time,
+    and send delivers it, returning a dict holding the sent message 'id'. Encoded messages are spooled to a file,
+    release_payload removes it once it is no longer needed.
+    """
+    def encode(self, message, attachments=()):
+        raise NotImplementedError
+
+    def release_payload(self, payload):
+        raise NotImplementedError
+
+    def send(self, payload):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class GmailBackend(EmailBackend):
+    """
+    Sends messages through the Gmail API reusing a single service client and HTTP connection.
+
+    The service is built once (discovery document, resource objects and TLS connection included) and the
+    credentials are only refreshed when they are about to expire. The Google libraries are imported by the methods
+    that use them, so sending through SMTP (or only rendering CVs) never pays for importing them.
+    """
+    def __init__(self, credentials, refresh_margin=300, api_endpoint=None, upload_chunk_size=1024*1024):
+        from google_auth_httplib2 import AuthorizedHttp
+        from googleapiclient.discovery import build
+        from googleapiclient.http import build_http
+
+        self.credentials = credentials
+        # Messages bigger than this are uploaded in resumable chunks of this size
+        self.upload_chunk_size = upload_chunk_size
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        # httplib2 keeps the connection to the API open between requests (build_http also stops it from following the 308s of resumable uploads)
+        self.http = AuthorizedHttp(credentials, http=build_http())
+        client_options = {'api_endpoint': api_endpoint} if api_endpoint else None
+        self.service = build('gmail', 'v1', http=self.http, cache_discovery=False, client_options=client_options)
+        self.messages = self.service.users().messages()
+        # The discovery document's batch URL ignores the endpoint override, so it's rebuilt for custom endpoints
+        self.batch_uri = f"{api_endpoint.rstrip('/')}/batch/gmail/v1" if api_endpoint else None
+        self.api_endpoint = api_endpoint
+        # httplib2 connections are not thread safe and the scheduler sends from worker threads
+        self.lock = threading.Lock()
+
+    def ensure_fresh_credentials(self):
+        expiry = getattr(self.credentials, 'expiry', None)
+        if not expiry or not getattr(self.credentials, 'refresh_token', None):
+            return
+        # google-auth stores the expiry as a naive UTC datetime
+        if expiry - datetime.utcnow() < self.refresh_margin:
+            from google.auth.transport.requests import Request
+            self.credentials.refresh(Request())
+
+    def encode(self, message, attachments=()):
+        return write_message(message, attachments)
+
+    def release_payload(self, message_path):
+        remove_message(message_path)
+
+    def send(self, message_path):
+        """
+        Uploads an encoded message file, so it never has to be held in memory as a whole.
+
+        Parameters:
+        message_path (str): The RFC 822 message file returned by encode.
+
+        Returns:
+        dict: The Gmail API response, holding the sent message 'id'.
+        """
+        from googleapiclient.http import MediaFileUpload
+
+        resumable = os.path.getsize(message_path) > self.upload_chunk_size
+        media = MediaFileUpload(message_path, mimetype='message/rfc822', chunksize=self.upload_chunk_size, resumable=resumable)
+        with self.lock:
+            self.ensure_fresh_credentials()
+            request = self.messages.send(userId='me', media_body=media)
+            if self.api_endpoint:
+                # Upload URLs keep the discovery document's scheme, custom endpoints (e.g. local mocks) may be plain http
+                request.uri = urlunparse(urlparse(request.uri)._replace(scheme=urlparse(self.api_endpoint).scheme))
+            if not resumable:
+                return request.execute()
+            response = None
+            while response is None:
+                _, response = request.next_chunk()
+            return response
+
+    def send_batch(self, messages):
+        """
+        Sends several already encoded messages in a single Gmail API batch HTTP request.
+        Batch requests can not upload files, so each message is read and sent inline.
+
+        Parameters:
+        messages (dict): The message files returned by encode keyed by a unique string id.
+
+        Returns:
+        dict: A (response, error) tuple for every id, exactly one of them being None.
+        """
+        from googleapiclient.http import BatchHttpRequest
+
+        results = {}
+        def collect(request_id, response, error):
+            results[request_id] = (response, error)
+        if self.batch_uri:
+            batch = BatchHttpRequest(callback=collect, batch_uri=self.batch_uri)
+        else:
+            batch = self.service.new_batch_http_request(callback=collect)
+        for request_id, message_path in messages.items():
+            batch.add(self.messages.send(userId='me', body={'raw': read_raw_message(message_path)}), request_id=request_id)
+        with self.lock, Metrics.span('send_batch', messages=len(messages)):
+            self.ensure_fresh_credentials()
+            batch.execute(http=self.http)
+        return results
+
+    def send_batches(self, messages, batch_size=50, per_minute=None, before_batch=None, rate_limiter=None, backoff=None):
+        """
+        Sends the messages in consecutive batches without ever exceeding the rate limits.
+
+        Parameters:
+        messages (dict): The message files returned by encode keyed by a unique string id, or an iterable of
+            (id, message file) pairs, only consumed one batch at a time so messages can be encoded as they are needed.
+        batch_size (int): The maximum amount of messages per batch (Gmail accepts up to 100, 50 is recommended).
+        per_minute (int): The maximum amount of messages sent in any 60 seconds window, unlimited when None.
+        before_batch (callable): Called with the ids of each batch right before it is sent.
+        rate_limiter (RateLimiter): The limits every message is sent under, replacing per_minute.
+        backoff (Backoff): Retries the batches, and the messages of a batch, throttled by the API. Not retried when None.
+
+        Yields:
+        dict: The results of each batch as returned by send_batch.
+        """
+        if rate_limiter is None and per_minute:
+            rate_limiter = RateLimiter({'perMinute': per_minute})
+        if rate_limiter and rate_limiter.capacity:
+            batch_size = min(batch_size, rate_limiter.capacity)
+        pending = iter(messages.items() if isinstance(messages, dict) else messages)
+        while True:
+            chunk = dict(islice(pending, batch_size))
+            if not chunk:
+                break
+            if rate_limiter:
+                # Waits until the whole batch fits within every limit
+                rate_limiter.wait(len(chunk))
+            if before_batch:
+                before_batch(list(chunk))
+            results = {}
+            attempt = 0
+            while chunk:
+                batch_results = backoff.call(self.send_batch, chunk) if backoff else self.send_batch(chunk)
+                results.update(batch_results)
+                # Only the messages the API throttled are sent again, the others already have their final result
+                throttled = {request_id: error for request_id, (_, error) in batch_results.items() if error is not None and is_quota_error(error)}
+                delay = backoff.on_quota_error(attempt, next(iter(throttled.values()))) if backoff and throttled else None
+                if delay is None:
+                    break
+                time.sleep(delay)
+                attempt += 1
+                chunk = {request_id: chunk[request_id] for request_id in throttled}
+            yield results
+
+class SmtpBackend(EmailBackend):
+    """
+    Sends messages through any SMTP server, keeping a pool of authenticated connections open.
+
+    Connections are created on demand up to pool_size and reused across messages, so the TCP, TLS and
+    authentication handshakes are only paid once per connection instead of once per email.
+    """
+    def __init__(self, host, port=587, username=None, password=None, sender=None, security='starttls', pool_size=2, timeout=60, idle_check=60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.security = security
+        self.pool_size = pool_size
+        self.timeout = timeout
+        # Connections idle for longer than this are checked with a NOOP before being reused
+        self.idle_check = idle_check
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def connect(self):
+        context = ssl.create_default_context()
+        if self.security == 'ssl':
+            connection = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout, context=context)
+        else:
+            connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.security == 'starttls':
+                connection.starttls(context=context)
+        if self.username and self.password:
+            connection.login(self.username, self.password)
+        return connection
+
+    def acquire(self):
+        while True:
+            try:
+                connection, released_at = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            if time.monotonic() - released_at < self.idle_check:
+                return connection
+            try:
+                connection.noop()
+                return connection
+            except smtplib.SMTPException:
+                self.discard(connection)
+        with self.lock:
+            can_create = self.created < self.pool_size
+            if can_create:
+                self.created += 1
+        if not can_create:
+            # Every connection is busy, waits for one to be released
+            connection, _ = self.idle.get()
+            return connection
+        try:
+            return self.connect()
+        except Exception:
+            with self.lock:
+                self.created -= 1
+            raise
+
+    def release(self, connection):
+        self.idle.put((connection, time.monotonic()))
+
+    def discard(self, connection):
+        with self.lock:
+            self.created -= 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def encode(self, message, attachments=()):
+        if 'From' not in message:
+            message['From'] = self.sender
+        if 'Message-ID' not in message:
+            message['Message-ID'] = make_msgid()
+        # Required by RFC 5322, the Gmail API adds it by itself but SMTP relays don't
+        if 'Date' not in message:
+            message['Date'] = formatdate(localtime=True)
+        recipients = [address for _, address in getaddresses(message.get_all('To', []) + message.get_all('Cc', []))]
+        return message['Message-ID'], recipients, write_message(message, attachments)
+
+    def release_payload(self, payload):
+        remove_message(payload[2])
+
+    def send_file(self, connection, recipients, message_path):
+        # Same exchange as smtplib's sendmail, but the DATA is streamed from the message file
+        connection.ehlo_or_helo_if_needed()
+        code, response = connection.mail(self.sender)
+        if code != 250:
+            connection.rset()
+            raise smtplib.SMTPSenderRefused(code, response, self.sender)
+        refused = {}
+        for recipient in recipients:
+            code, response = connection.rcpt(recipient)
+            if code not in (250, 251):
+                refused[recipient] = (code, response)
+        if len(refused) == len(recipients):
+            connection.rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+        code, response = connection.docmd('data')
+        if code != 354:
+            connection.rset()
+            raise smtplib.SMTPDataError(code, response)
+        buffer = bytearray()
+        last_line = b''
+        with open(message_path, 'rb') as message:
+            for line in message:
+                # Lines starting with a dot are escaped, the message file already uses CRLF line endings
+                if line.startswith(b'.'):
+                    buffer += b'.'
+                buffer += line
+                last_line = line
+                if len(buffer) >= chunk_size:
+                    connection.send(bytes(buffer))
+                    buffer.clear()
+        if not last_line.endswith(b'\r\n'):
+            buffer += b'\r\n'
+        buffer += b'.\r\n'
+        connection.send(bytes(buffer))
+        code, response = connection.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, response)
+
+    def send(self, payload):
+        message_id, recipients, message_path = payload
+        connection = self.acquire()
+        try:
+            self.send_file(connection, recipients, message_path)
+        except smtplib.SMTPServerDisconnected:
+            # The server closed an idle connection, retries once on a fresh one
+            self.discard(connection)
+            connection = self.acquire()
+            try:
+                self.send_file(connection, recipients, message_path)
+            except Exception:
+                self.discard(connection)
+                raise
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError, smtplib.SMTPSenderRefused):
+            # The message was refused but the connection is still usable
+            self.release(connection)
+            raise
+        except Exception:
+            self.discard(connection)
+            raise
+        self.release(connection)
+        return {'id': message_id}
+
+    def close(self):
+        while True:
+            try:
+                connection, _ = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                connection.quit()
+            except Exception:
+                pass
+            with self.lock:
+                self.created -= 1
@@ -0,0 +1,114 @@
+import random
+
+from string import Formatter
+
+# Used when curriculum.json has no 'subject' in its 'message'
+default_subject = "Application for {position} at {company}"
+
+# HTML document every email body is wrapped in
+body_wrapper = """
+    <html>
+    <body>
+        {opening}
+        {constant}
+        {variable}
+        {ending}
+    </body>
+    </html>
+    """
+
+def compile_text(text, source):
+    """
+    Splits a str.format style text into literal segments and placeholders, once.
+
+    Parameters:
+    text (str): The text to compile.
+    source (str): Where the text comes from, used in error messages.
+
+    Returns:
+    tuple: (literal, field, format_spec, conversion) segments, field being None for the last literal.
+    """
+    try:
+        segments = tuple(Formatter().parse(text))
+    except ValueError as error:
+        raise ValueError(f"Invalid template in {source}: {error}") from None
+    for _, field, format_spec, _ in segments:
+        if field is not None and not field.isidentifier():
+            raise ValueError(f"Invalid placeholder {{{field}}} in {source}, only simple names such as {{company}} are supported.")
+        if format_spec and '{' in format_spec:
+            raise ValueError(f"Nested placeholders are not supported in {source}.")
+    return segments
+
+def render_text(segments, fields):
+    parts = []
+    for literal, field, format_spec, conversion in segments:
+        parts.append(literal)
+        if field is not None:
+            value = fields[field]
+            if conversion == 'r':
+                value = repr(value)
+            elif conversion == 'a':
+                value = ascii(value)
+            elif conversion == 's':
+                value = str(value)
+            parts.append(format(value, format_spec or ''))
+    return ''.join(parts)
+
+def get_fields(segments):
+    return {field for _, field, _, _ in segments if field is not None}
+
+class EmailTemplate:
+    """
+    The 'message' block of curriculum.json compiled once into ready to render segments.
+
+    Every placeholder can use {company}, {position}, {name} and any other field of the company entry
+    (e.g. {email}, or a custom {city} added to that company in curriculum.json).
+    """
+    def __init__(self, data):
+        message = data['message']
+        self.name = data['name']
+        # The static arrays are joined a single time instead of once per company
+        self.opening = compile_text("".join(message['opening']), "message.opening")
+        self.constant = compile_text("".join(message['constant']), "message.constant")
+        self.variables = [compile_text(variable, f"message.variable[{index}]") for index, variable in enumerate(message['variable'])]
+        self.ending = compile_text("".join(message['ending']), "message.ending")
+        self.subject = compile_text(message.get('subject', default_subject), "message.subject")
+        if not self.variables:
+            raise ValueError("message.variable needs at least one entry.")
+
+        self.fields = get_fields(self.opening) | get_fields(self.constant) | get_fields(self.ending) | get_fields(self.subject)
+        for variable in self.variables:
+            self.fields |= get_fields(variable)
+
+    def get_company_fields(self, company_name, position, company=None):
+        fields = {key: value for key, value in (company or {}).items() if isinstance(value, (str, int, float))}
+        fields.update({'company': company_name, 'position': position, 'name': self.name})
+        return fields
+
+    def validate(self, companies):
+        """
+        Checks every company provides every placeholder, so a typo fails at startup rather than hours into a campaign.
+
+        Parameters:
+        companies (list): (company_name, position, company entry) tuples.
+
+        Returns:
+        list: One error message per company missing a placeholder.
+        """
+        errors = []
+        for company_name, position, company in companies:
+            missing = self.fields - self.get_company_fields(company_name, position, company).keys()
+            if missing:
+                errors.append(f"{company_name} has no value for {', '.join('{' + field + '}' for field in sorted(missing))}")
+        return errors
+
+    def render(self, company_name, position, company=None):
+        fields = self.get_company_fields(company_name, position, company)
+        body = body_wrapper.format(
+            opening=render_text(self.opening, fields),
+            constant=render_text(self.constant, fields),
+            variable=render_text(random.choice(self.variables), fields),
+            ending=render_text(self.ending, fields)
+        )
+        return render_text(self.subject, fields), body
+
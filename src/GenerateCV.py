@@ -1,26 +1,222 @@
 import os
 import json
-import templates.Base as template
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import Metrics
 
-def generate_cv_for_companies(data='curriculum.json',pdf_folder='output'):
+from CompanySource import iter_companies
+from Manifest import load_manifest, save_manifest, get_base_hash, get_company_hash, is_up_to_date, record_build
+from Tailoring import KeywordIndex, get_job_description
+from TemplateRegistry import defaultTemplate, defaultPageSize, defaultOutputProfile, pageSizes, get_template, is_two_phase, call, get_variants
+
+# Allowed image extensions
+image_extensions = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.pict')
+
+# Base layouts kept in memory at once, tailored CVs can need one per distinct content
+base_pdf_cache_size = 32
+
+def render_company_cv(output_path, data, company_logo_path='', variant=(defaultTemplate, defaultPageSize), output_profile=defaultOutputProfile, base_pdf=None):
+    # Renders a single CV and returns the path actually written along with the time it took.
+    # Kept at module level so it can be pickled and shipped to the worker processes.
+    start = time.perf_counter()
+    template_name, page_size_name = variant
+    template = get_template(template_name)
+    options = {'output_profile': output_profile, 'page_size': pageSizes[page_size_name]}
+    if base_pdf is not None:
+        # Two-phase render: only the watermark layer is drawn for this company
+        written_path = call(template, 'stamp_watermark', base_pdf, output_path, company_logo_path, **options)
+    else:
+        written_path = call(template, 'generate_pdf_from_json', output_path, data, company_logo_path, **options)
+    return written_path, time.perf_counter() - start
+
+def get_cv_name(company_name, variant, primary):
+    # The first layout of a company keeps the plain name, it's the CV attached to its emails
+    if primary:
+        return company_name
+    return f"{company_name}[{variant[0]},{variant[1]}]"
+
+def get_cv_path(pdf_folder, company_name, variant, primary):
+    prefix = 'curriculum' if company_name == 'curriculum' else f"curriculum_{company_name}"
+    suffix = '' if primary else f"_{variant[0]}_{variant[1]}"
+    return os.path.join(pdf_folder, f"{prefix}{suffix}.pdf")
+
+def print_render_summary(results, errors, elapsed, sizes):
+    rendered = len(results)
+    total = sum(duration for _, _, duration in results)
+    print(f"<- CV GENERATOR -> Rendered {rendered} CV(s) in {elapsed:.2f}s ({len(errors)} failed).")
+    if rendered:
+        slowest_name, _, slowest = max(results, key=lambda result: result[2])
+        print(f"<- CV GENERATOR -> Average render: {total/rendered:.2f}s | Slowest: {slowest_name} ({slowest:.2f}s)")
+        largest_name = max(sizes, key=sizes.get)
+        print(f"<- CV GENERATOR -> Average size: {sum(sizes.values())/rendered/1024:.1f} KB | Largest: {largest_name} ({sizes[largest_name]/1024:.1f} KB)")
+    for company_name, error in errors:
+        print(f"<- CV GENERATOR -> ERROR: Failed to render CV for {company_name}: {error}")
+
+def generate_cv_for_companies(data='curriculum.json', pdf_folder='output', workers=1, force=False, profile=False, shard=None, output_profile=None, executor=None):
     if data == 'curriculum.json':
         # Get data from the configuration file
-        with open(configuration_file, 'r', encoding='utf-8') as file:
+        with open(data, 'r', encoding='utf-8') as file:
             data = json.load(file)
+    # The profile given on the command line wins over the configured one
+    output_profile = output_profile or data.get('outputProfile', defaultOutputProfile)
+
+    manifest = load_manifest(pdf_folder)
+    skipped = 0
+    hashes = {}
+    order = {}
+    # Shared by every company rendered with the same template, page size and content, built the first time one needs it
+    base_hashes = {}
+    base_pdfs = OrderedDict()
+    # Built on the first company with a job description, then used by all of them
+    keyword_index = None
+
+    def get_variant_hash(variant): # Hash of the inputs shared by every CV of a layout, each company then adds its own logo on top
+        if variant not in base_hashes:
+            template_name, page_size_name = variant
+            template_version = getattr(get_template(template_name), 'templateVersion', '')
+            base_hashes[variant] = get_base_hash(data, f"{template_name}/{template_version}/{page_size_name}/{output_profile}")
+        return base_hashes[variant]
+
+    def get_base_pdf(variant, content_key, cv_data): # The CV body of a layout, laid out once and shared by every company using it
+        template_name, page_size_name = variant
+        template = get_template(template_name)
+        if not is_two_phase(template):
+            return None
+        key = (variant, content_key)
+        if key in base_pdfs:
+            base_pdfs.move_to_end(key)
+        else:
+            start = time.perf_counter()
+            with Metrics.span('base_layout', template=template_name, pageSize=page_size_name):
+                base_pdfs[key] = call(template, 'generate_base_pdf', cv_data, output_profile=output_profile, page_size=pageSizes[page_size_name])
+            if len(base_pdfs) > base_pdf_cache_size:
+                base_pdfs.popitem(last=False)
+            tailored = ', tailored' if content_key else ''
+            print(f"<- CV GENERATOR -> {template_name} layout ({page_size_name}{tailored}) rendered in {time.perf_counter() - start:.2f}s.")
+        return base_pdfs[key]
 
-    # Allowed image extensions
-    image_extensions = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.pict')
+    def get_content(company): # The curriculum reordered for the company's job description, the shared one when it has none
+        nonlocal keyword_index
+        job_description = get_job_description(company)
+        if not job_description:
+            return '', data
+        with Metrics.span('tailor'):
+            if keyword_index is None:
+                keyword_index = KeywordIndex(data)
+            return keyword_index.tailor(job_description, data.get('tailoring'))
 
-    # Generates one custom PDF for each target company found
-    companies = data.get('companies','')
-    if companies:
-        for company in companies:
+    def get_layouts(company_name, company=None): # Every template and page size combination of a company
+        for index, variant in enumerate(get_variants(data, company)):
+            cv_name = get_cv_name(company_name, variant, index == 0)
+            try:
+                get_template(variant[0])
+            except (ValueError, ImportError) as error:
+                print(f"<- CV GENERATOR -> Skipping {cv_name}: {error}")
+                continue
+            yield cv_name, variant, get_cv_path(pdf_folder, company_name, variant, index == 0)
+
+    def get_candidates(): # One candidate per target company and layout found, read from the company source as they are needed
+        for company in iter_companies(data, shard):
             company_logo = company['logo']
             company_logo_path = f"logos/{company_logo}"
             company_name, ext = os.path.splitext(company_logo)
             if os.path.exists(company_logo_path) and ext.lower() in image_extensions:
-                output_path = os.path.join(pdf_folder, f"curriculum_{company_name}.pdf")
-                template.generate_pdf_from_json(output_path, data, company_logo_path)
+                # Tailored once per company, every layout of the company shows the same content
+                content_key, cv_data = get_content(company)
+                for cv_name, variant, output_path in get_layouts(company_name, company):
+                    yield cv_name, variant, output_path, company_logo_path, content_key, cv_data
+        # One final company agnostic curriculum per default layout, built by a single shard
+        if not shard or shard[0] == 0:
+            for cv_name, variant, output_path in get_layouts('curriculum'):
+                yield cv_name, variant, output_path, '', '', data
+
+    def get_jobs(): # Only CVs whose inputs changed since their last build are rendered again
+        nonlocal skipped
+        for cv_name, variant, output_path, company_logo_path, content_key, cv_data in get_candidates():
+            hashes[cv_name] = get_company_hash(get_variant_hash(variant), company_logo_path, content_key)
+            if not force and is_up_to_date(manifest, cv_name, hashes[cv_name]):
+                skipped += 1
+            else:
+                order[cv_name] = len(order)
+                yield cv_name, variant, output_path, company_logo_path, content_key, cv_data
+
+    def render(job):
+        cv_name, variant, output_path, company_logo_path, content_key, cv_data = job
+        try:
+            written_path, duration = render_company_cv(output_path, cv_data, company_logo_path, variant, output_profile, get_base_pdf(variant, content_key, cv_data))
+            results.append((cv_name, written_path, duration))
+        except Exception as error:
+            errors.append((cv_name, error))
+
+    def collect(futures):
+        for future in futures:
+            cv_name = in_flight.pop(future)
+            try:
+                written_path, duration = future.result()
+                results.append((cv_name, written_path, duration))
+            except Exception as error:
+                errors.append((cv_name, error))
+
+    jobs = get_jobs()
+    first_job = next(jobs, None)
+    if first_job is None:
+        if skipped:
+            print(f"<- CV GENERATOR -> {skipped} CV(s) are up to date, skipping them.")
+        print("<- CV GENERATOR -> Nothing to render.")
+        return [], []
+
+    results = []
+    errors = []
+    start = time.perf_counter()
+
+    if profile:
+        # Profiled in this process, a worker's profile would be lost. For two-phase templates it includes the base layout,
+        # which is where almost all the rendering time goes.
+        with Metrics.profile(first_job[0]):
+            render(first_job)
+    else:
+        jobs = chain([first_job], jobs)
+
+    if workers > 1:
+        print(f"<- CV GENERATOR -> Rendering CVs across {workers} workers...")
+        in_flight = {}
+        # Long running callers (e.g. watch mode) pass their own pool, so its workers stay warm between builds
+        with nullcontext(executor) if executor else ProcessPoolExecutor(max_workers=workers) as executor:
+            for cv_name, variant, output_path, company_logo_path, content_key, cv_data in jobs:
+                # Only a few jobs per worker are queued at a time, so long company lists are never loaded as a whole
+                if len(in_flight) >= workers * 4:
+                    collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+                # Base layouts are rendered here once and sent along with each job, the workers only stamp them
+                try:
+                    variant_base_pdf = get_base_pdf(variant, content_key, cv_data)
+                except Exception as error:
+                    errors.append((cv_name, error))
+                    continue
+                in_flight[executor.submit(render_company_cv, output_path, cv_data, company_logo_path, variant, output_profile, variant_base_pdf)] = cv_name
+            collect(list(in_flight))
+    else:
+        for job in jobs:
+            render(job)
+    if skipped:
+        print(f"<- CV GENERATOR -> {skipped} CV(s) are up to date, skipped them.")
+
+    sizes = {}
+    for cv_name, written_path, duration in results:
+        record_build(manifest, cv_name, hashes[cv_name], written_path)
+        # Timed and measured here since the renders of worker processes are not recorded by this process' metrics
+        Metrics.observe('render_company', duration, company=cv_name)
+        sizes[cv_name] = os.path.getsize(written_path)
+    Metrics.increment('pdf_bytes', sum(sizes.values()))
+    Metrics.increment('cvs_rendered', len(results))
+    Metrics.increment('cvs_failed', len(errors))
+    Metrics.increment('cvs_up_to_date', skipped)
+    save_manifest(pdf_folder, manifest)
 
-    # Generates one final company agnostic curriculum
-    template.generate_pdf_from_json(f'{pdf_folder}/curriculum.pdf', data)
\ No newline at end of file
+    # Keep the report in configuration order regardless of completion order
+    results.sort(key=lambda result: order[result[0]])
+    errors.sort(key=lambda error: order[error[0]])
+    print_render_summary(results, errors, time.perf_counter() - start, sizes)
+    return results, errors
@@ -1,29 +1,29 @@
 import os
 import re
 import sys
-import glob
-import json
 import time
-import base64
-import random
-import smtplib
+import json
 import getpass
 import logging
 
 from datetime import datetime
+from functools import lru_cache, partial
 from email.message import EmailMessage
 from email.contentmanager import ContentManager
 from email.policy import default
-from email import encoders
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+
+import Metrics
 
 from Utils import get_integer_input
+from EmailTemplate import EmailTemplate
+from CompanySource import iter_companies
+from EmailBackends import GmailBackend, SmtpBackend
+from Manifest import load_manifest, get_latest_cv
+from RateLimit import defaultLimits, create_pacing, describe_limits
+from Scheduler import SendScheduler
+from SendQueue import SendQueue
 
 def is_valid_email(email):
     # Regular expression for validating an email address
@@ -32,25 +32,24 @@ def is_valid_email(email):
     )
     return re.match(email_regex, email) is not None
 
-def generate_email_body(company_name, position, data):
-    opening = "".join(data['message']['opening']).format(company=company_name)
-    constant = "".join(data['message']['constant']).format(position=position)
-    variable = random.choice(data['message']['variable']).format(company=company_name)
-    ending = "".join(data['message']['ending']).format(name=data['name'])
-
-    email_body = f"""
-    <html>
-    <body>
-        {opening}
-        {constant}
-        {variable}
-        {ending}
-    </body>
-    </html>
-    """
+@lru_cache(maxsize=8)
+def get_email_template(source):
+    # Compiled once per distinct 'name' and 'message', then reused by every email rendered from them
+    name, message = json.loads(source)
+    return EmailTemplate({'name': name, 'message': message})
+
+def generate_email_body(company_name, position, data, email_template=None):
+    # Campaigns pass the template they compiled, single emails reuse the one compiled for the same message
+    email_template = email_template or get_email_template(json.dumps([data['name'], data['message']]))
+    email_subject, email_body = email_template.render(company_name, position)
     return email_body
 
 def authenticate_gmail():
+    # The Google libraries take a while to import, they are only loaded when sending through GMail
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
     credentials = None
     if os.path.exists('token.json'):
         try:
@@ -74,50 +73,83 @@ def authenticate_gmail():
             token.write(credentials.to_json())
     return credentials
 
-def send_gmail(company_name, position, email_receiver, pdf_path, attachment_name, email_body, credentials):
-    service = build('gmail', 'v1', credentials=credentials)
-    email_subject = f"Application for {position} at {company_name}"
+def build_email_message(company_name, position, email_receiver, pdf_path, attachment_name, email_body, email_subject=None):
+    email_subject = email_subject or f"Application for {position} at {company_name}"
 
     message = MIMEMultipart()
     message['to'] = email_receiver
     message['subject'] = email_subject
 
-    message.attach(MIMEText(email_body, 'html'))
+    # Encoded as base64 so long HTML lines never break the SMTP line length limit
+    message.attach(MIMEText(email_body, 'html', 'utf-8'))
 
+    # The attachment is only streamed into the message when it is encoded by the backend
+    attachments = []
     if os.path.exists(pdf_path):
-        with open(pdf_path, 'rb') as attachment:
-            part = MIMEBase('application', 'octet-stream')
-            part.set_payload(attachment.read())
-            encoders.encode_base64(part)
-            part.add_header('Content-Disposition', f'attachment; filename={os.path.basename(attachment_name)}')
-            message.attach(part)
+        attachments.append((pdf_path, os.path.basename(attachment_name)))
+
+    return message, email_subject, attachments
 
-    raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-    message = {'raw': raw_message}
+def send_gmail(company_name, position, email_receiver, pdf_path, attachment_name, email_body, credentials, backend=None):
+    message, email_subject, attachments = build_email_message(company_name, position, email_receiver, pdf_path, attachment_name, email_body)
 
+    # Reuse the caller's backend when sending several emails, so the service is only built once
+    backend = backend or GmailBackend(credentials)
+    payload = backend.encode(message, attachments)
     try:
-        service.users().messages().send(userId='me', body=message).execute()
+        backend.send(payload)
         # Log the email details
         logging.info(f"Generated Email - Recipient: {email_receiver} | Subject: {email_subject}\nBody: {email_body}")
         print(f"<- EMAIL GENERATOR -> Email sent to {email_receiver}")
     except Exception as error:
         print(f"<- EMAIL GENERATOR -> ERROR: {error}")
+    finally:
+        backend.release_payload(payload)
+
+def authenticate_smtp(smtp, email_sender):
+    # An empty username sends without authenticating, e.g. through an internal relay
+    username = smtp.get('username', email_sender)
+    password = None
+    if username:
+        # The password is never stored in curriculum.json
+        password = os.environ.get('JOBFINDER_SMTP_PASSWORD') or getpass.getpass(f"<- EMAIL GENERATOR -> SMTP password for {username}: ")
+    backend = SmtpBackend(
+        smtp['host'],
+        smtp.get('port', 587),
+        username,
+        password,
+        email_sender,
+        smtp.get('security', 'starttls'),
+        smtp.get('poolSize', 2)
+    )
+    try:
+        # Opens the first pooled connection right away so bad credentials are reported before the schedule starts
+        backend.release(backend.acquire())
+    except Exception as error:
+        logging.error(f"A problem happened authenticating on {smtp['host']}: {error}")
+        print(f"<- EMAIL GENERATOR -> ERROR: {error}")
+        sys.exit()
+    return backend
 
 def get_most_recent_company_cv(company_cv_path):
     """
-    Fetches the most recent file starting with the given prefix.
+    Fetches the most recent CV of a company: the file named after the given prefix, or that name with a GUID appended.
+    The CVs of the company's other layouts (e.g. 'curriculum_Acme_Base_A4.pdf') are never picked.
     
     Parameters:
-    company_cv_path (str): The prefix of the files to search for.
+    company_cv_path (str): The path of the CV without its extension, e.g. 'output/curriculum_Acme'.
     
     Returns:
     str: The path to the most recent file.
     """
-    # Add wildcard to search_pattern
-    search_pattern = f"{company_cv_path}*"
-    
-    # Get a list of files matching the pattern
-    files = glob.glob(search_pattern)
+    directory, prefix = os.path.split(company_cv_path)
+    directory = directory or '.'
+    # Only 'curriculum_<Company>.pdf' and 'curriculum_<Company>_<32 hex characters GUID>.pdf'
+    pattern = re.compile(rf"{re.escape(prefix)}(_[0-9a-f]{{32}})?\.pdf")
+    try:
+        files = [os.path.join(directory, name) for name in os.listdir(directory) if pattern.fullmatch(name)]
+    except FileNotFoundError:
+        return None
     
     if not files:
         return None
@@ -149,25 +181,46 @@ def configure_logging(log_dir='email'):
         datefmt='%Y-%m-%d %H:%M:%S'
     )
 
-def send_cv_email_to_companies(data, pdf_folder):
-    def configure_email_interval(email_interval_minimum, email_interval_maximum): #  Configures the intervals that will be used
-        if email_interval_minimum < 30:
-            print(f"<- EMAIL GENERATOR -> ERROR: Interval Minimum of {email_interval_minimum} minutes is lower than 30 minutes!\n<- EMAIL GENERATOR -> Applying default values instead...")
-            email_interval_minimum = 30
-        
-        if email_interval_maximum < 30:
-            print(f"<- EMAIL GENERATOR -> ERROR: Interval Maximum of {email_interval_maximum} minutes is lower than 30 minutes!\n<- EMAIL GENERATOR -> Applying default values instead...")
-            email_interval_maximum = 60 
-        
+def get_default_sender(data):
+    smtp = data.get('smtp')
+    return smtp.get('sender', data['contact']['email']) if smtp else data['contact']['email']
+
+def send_cv_email_to_companies(data, pdf_folder, retry_failed=False, email_sender=None, shard=None):
+    def configure_email_interval(email_interval_minimum, email_interval_maximum): #  Configures the randomized spacing between emails, the rate limits are what keeps the sender within its quota
         if email_interval_maximum < email_interval_minimum:
-            print(f"<- EMAIL GENERATOR -> ERROR: Interval Maximum of {email_interval_maximum} minutes is lower than Interval Minimum of {email_interval_minimum} minutes!\n<- EMAIL GENERATOR -> Applying default values instead...")
-            email_interval_minimum = 30 # 30 minutes is the minimum so we don't reach GMail API's cap
-            email_interval_maximum = 60 # 60 minutes is the maximum range the application will randomize
-        print(f"<- EMAIL GENERATOR -> Interval set to {email_interval_minimum} - {email_interval_maximum} minutes")
+            print(f"<- EMAIL GENERATOR -> ERROR: Interval Maximum of {email_interval_maximum} minutes is lower than Interval Minimum of {email_interval_minimum} minutes!\n<- EMAIL GENERATOR -> Applying the Interval Minimum to both instead...")
+            email_interval_maximum = email_interval_minimum
+        if email_interval_maximum:
+            print(f"<- EMAIL GENERATOR -> Interval set to {email_interval_minimum} - {email_interval_maximum} minutes")
+        else:
+            print("<- EMAIL GENERATOR -> No interval between emails, they are only paced by the rate limits")
         return email_interval_minimum, email_interval_maximum
     
-    def engage_email_authentication(): # Engages in I/O with the user to configure the email with the GMail API.
-        email = data['contact']['email']
+    def engage_email_authentication(): # Engages in I/O with the user to configure the sender email and the transport used to send it.
+        nonlocal email_sender
+        smtp = data.get('smtp')
+
+        def is_supported(email_sender): # Any valid address can be sent through SMTP, the GMail API only sends from GMail addresses
+            return is_valid_email(email_sender) and (smtp or email_sender.endswith('@gmail.com'))
+
+        def authenticate(email_sender):
+            if smtp:
+                print(f"<- EMAIL GENERATOR -> SMTP server configured. Attempting to authenticate on {smtp['host']}...")
+                backend = authenticate_smtp(smtp, email_sender)
+                print("<- EMAIL GENERATOR -> Successfully authenticated through SMTP! Sending...")
+            else:
+                print(f"<- EMAIL GENERATOR -> GMail detected. Attempting to authenticate and send emails through GMail API...")
+                backend = GmailBackend(authenticate_gmail())
+                print("<- EMAIL GENERATOR -> Successfully authenticated GMail! Sending...")
+            return backend
+
+        if email_sender: # Non-interactive run, the sender was given upfront
+            if not is_supported(email_sender):
+                print(f"<- EMAIL GENERATOR -> ERROR: The email '{email_sender}' is not valid{'' if smtp else ' (only GMAIL supported)'}.")
+                sys.exit()
+            return authenticate(email_sender)
+
+        email = get_default_sender(data)
         print(f"<- EMAIL GENERATOR -> Do you wish to use {email} as your sender email?")
         print("\t[1] Yes")
         print("\t[2] No")
@@ -177,65 +230,194 @@ def send_cv_email_to_companies(data, pdf_folder):
         authenticated = False
         if choice == 1:
             email_sender = email
-            email_valid = is_valid_email(email_sender)
-            if not email_valid or not email_sender.endswith('@gmail.com'):
+            email_valid = is_supported(email_sender)
+            if not email_valid:
                 print(f"{email_sender} is invalid.")
             else:
-                print(f"<- EMAIL GENERATOR -> GMail detected. Attempting to authenticate and send emails through GMail API...")
-                credentials = authenticate_gmail()
+                backend = authenticate(email_sender)
                 authenticated = True
-                print("<- EMAIL GENERATOR -> Successfully authenticated GMail! Sending...")
         
         while not email_valid or not authenticated:
-            email_sender = input("<- EMAIL GENERATOR -> Enter your email address (only GMAIL supported): ")
-            email_valid = is_valid_email(email_sender)
-            if not email_valid or not email_sender.endswith('@gmail.com'):
+            email_sender = input(f"<- EMAIL GENERATOR -> Enter your email address{'' if smtp else ' (only GMAIL supported)'}: ")
+            email_valid = is_supported(email_sender)
+            if not email_valid:
                 print(f"<- EMAIL GENERATOR -> The email '{email_sender}' is not valid, please re-type.")
             else:
-                print(f"<- EMAIL GENERATOR -> GMail detected. Attempting to authenticate and send emails through GMail API...")
-                credentials = authenticate_gmail()
+                backend = authenticate(email_sender)
                 authenticated = True
-                print("<- EMAIL GENERATOR -> Successfully authenticated GMail! Sending...")
-        return credentials
+        return backend
     
-    def process_emails(credentials): # Going through every company and sending the CV
-        companies = data['companies']
-        first_iteration = True
-        for company in companies:
-            # Doesn't wait an interval on the first iteration
-            if not first_iteration: 
-                interval_between_email = random.randint(email_interval_minimum, email_interval_maximum)
-                print(f"<- EMAIL GENERATOR -> Waiting {interval_between_email} minutes before sending the next email...")
-                time.sleep(interval_between_email*60) # Sleeps {interval_between_email} minutes
-            first_iteration = False
-
-            company_name, company_logo_extension = os.path.splitext(company['logo'])
-            recipient_email = company['email']
-            position = company.get('position', 'Senior Fullstack Developer')
-            company_cv_path = os.path.join(pdf_folder, f"curriculum_{company_name}.pdf")
-            
-            print(f"<- EMAIL GENERATOR -> Company: {company_name}, Position: {position}, BaseCV: {company_cv_path}")
-            if os.path.exists(company_cv_path):
-                company_cv_pattern, company_cv_extension = os.path.splitext(company_cv_path)
-                # This function gets all the files starting with 'company_cv' with all the different generated GUIDs and fetches the most recently created to be used.
-                # This is essential because there's no way to predict the most recent GUID generated (if any).
-                most_recent_company_cv = get_most_recent_company_cv(company_cv_pattern)
-                print(f"<- EMAIL GENERATOR -> Most recent company CV found: {most_recent_company_cv}")
-                
-                # Should be impossible to not find the most recent company CV. With this validation we can skip sending an email without CV.
-                if not most_recent_company_cv:
-                    print(f"<- EMAIL GENERATOR -> ERROR: Failed to get a CV for {company_name} in {pdf_folder}. Aborting this email.")
+    def prepare_email(company): # Runs in the background, ahead of the send schedule
+        company_name, company_logo_extension = os.path.splitext(company['logo'])
+        recipient_email = company['email']
+        position = company.get('position', 'Senior Fullstack Developer')
+        company_cv_path = os.path.join(pdf_folder, f"curriculum_{company_name}.pdf")
+
+        print(f"<- EMAIL GENERATOR -> Company: {company_name}, Position: {position}, BaseCV: {company_cv_path}")
+        # The build manifest indexes the latest CV written for each company
+        most_recent_company_cv = get_latest_cv(manifest, company_name)
+        if not most_recent_company_cv and os.path.exists(company_cv_path):
+            company_cv_pattern, company_cv_extension = os.path.splitext(company_cv_path)
+            # Fallback for CVs built before the manifest existed: gets all the files starting with 'company_cv' with all the different generated GUIDs and fetches the most recently created to be used.
+            most_recent_company_cv = get_most_recent_company_cv(company_cv_pattern)
+
+        if not most_recent_company_cv:
+            print(f"<- EMAIL GENERATOR -> PDF for {company_name} not found in {pdf_folder}. Skipping...")
+            send_queue.mark_skipped(company_name, recipient_email)
+            Metrics.increment('emails_skipped')
+            return None
+        print(f"<- EMAIL GENERATOR -> Most recent company CV found: {most_recent_company_cv}")
+        email_subject, email_body = email_template.render(company_name, position, company)
+        print(f"<- EMAIL GENERATOR -> Email body: {email_body}")
+        with Metrics.span('mime_build', company=company_name):
+            message, email_subject, attachments = build_email_message(company_name, position, recipient_email, most_recent_company_cv, company_cv_path, email_body, email_subject)
+            payload = backend.encode(message, attachments)
+        return company_name, recipient_email, email_subject, email_body, payload
+
+    def send_email(prepared_email, backend): # Fired by the scheduler at the email's scheduled time
+        company_name, recipient_email, email_subject, email_body, message = prepared_email
+        send_queue.mark_sending(company_name, recipient_email)
+        try:
+            with Metrics.span('send', company=company_name):
+                # Sent again after a jittered delay when the server throttles the sender
+                response = backoff.call(backend.send, message)
+        except Exception as error:
+            send_queue.mark_failed(company_name, recipient_email, error)
+            Metrics.increment('emails_failed')
+            raise
+        finally:
+            backend.release_payload(message)
+        send_queue.mark_sent(company_name, recipient_email, response.get('id') if isinstance(response, dict) else None)
+        Metrics.increment('emails_sent')
+        # Log the email details
+        logging.info(f"Generated Email - Recipient: {recipient_email} | Subject: {email_subject}\nBody: {email_body}")
+        print(f"<- EMAIL GENERATOR -> Email sent to {recipient_email}")
+
+    def process_emails(): # Going through every company still waiting for its email and sending the CV
+        def get_queue_entries():
+            for company in iter_companies(data, shard, report=False):
+                company_name, company_logo_extension = os.path.splitext(company['logo'])
+                yield company_name, company['email'], company.get('position', 'Senior Fullstack Developer')
+        interrupted = send_queue.sync(get_queue_entries())
+        if interrupted:
+            print(f"<- EMAIL GENERATOR -> {interrupted} email(s) were interrupted while sending on the last run and were marked as failed.")
+        if retry_failed:
+            print(f"<- EMAIL GENERATOR -> Retrying {send_queue.retry_failed()} failed email(s)...")
+
+        already_processed = 0
+        def get_jobs(): # Read from the company source as they are needed, the batches never load the whole list
+            nonlocal already_processed
+            for company in iter_companies(data, shard, report=False):
+                company_name, company_logo_extension = os.path.splitext(company['logo'])
+                if send_queue.should_send(company_name, company['email']):
+                    yield company_name, partial(prepare_email, company), partial(send_email, backend=backend)
                 else:
-                    email_body = generate_email_body(company_name, position, data)
-                    print(f"<- EMAIL GENERATOR -> Email body: {email_body}")
-                    send_gmail(company_name, position, recipient_email, most_recent_company_cv, company_cv_path, email_body, credentials)
-            else:
-                print(f"<- EMAIL GENERATOR -> PDF for {company_name} not found in {pdf_folder}. Skipping...")
+                    already_processed += 1
+        def print_resuming():
+            if already_processed:
+                print(f"<- EMAIL GENERATOR -> Resuming the campaign, {already_processed} company(ies) were already processed on a previous run {send_queue.counts()}.")
+
+        try:
+            if batch_configuration:
+                progress = process_email_batches(get_jobs(), backend)
+                print_resuming()
+                return progress
+            # The schedule is planned upfront, so it needs the whole list of pending emails
+            jobs = list(get_jobs())
+            print_resuming()
+            if not jobs:
+                print("<- EMAIL GENERATOR -> No emails left to send.")
+                return None
+            # Emails prepared but never sent, e.g. when the run is interrupted, don't leave their spooled message behind
+            release = lambda prepared_email: backend.release_payload(prepared_email[4])
+            scheduler = SendScheduler(jobs, email_interval_minimum, email_interval_maximum, rate_limiter=rate_limiter, release=release)
+            return scheduler.start()
+        finally:
+            backend.close()
+
+    def process_email_batches(jobs, backend): # Bulk mode: groups the emails into Gmail API batch requests instead of spacing them out
+        batch_size = batch_configuration.get('size', 50)
+        print(f"<- EMAIL GENERATOR -> Batch mode: sending up to {batch_size} emails per request, intervals are ignored.")
+        total = skipped = 0
+        # Only the emails of the batch being sent are prepared (and spooled to disk) at any time
+        prepared_emails = {}
+        def get_messages():
+            nonlocal total, skipped
+            for company_name, prepare, _ in jobs:
+                total += 1
+                prepared_email = prepare()
+                if prepared_email:
+                    prepared_emails[company_name] = prepared_email
+                    yield company_name, prepared_email[4]
+                else:
+                    skipped += 1
+
+        sent = failed = 0
+        def mark_batch_sending(company_names):
+            for company_name in company_names:
+                send_queue.mark_sending(company_name, prepared_emails[company_name][1])
+        for results in backend.send_batches(get_messages(), batch_size, before_batch=mark_batch_sending, rate_limiter=rate_limiter, backoff=backoff):
+            # Every result is mapped back to its company so failures can be retried one by one
+            for company_name, (response, error) in results.items():
+                _, recipient_email, email_subject, email_body, message = prepared_emails.pop(company_name)
+                if error:
+                    send_queue.mark_failed(company_name, recipient_email, error)
+                    print(f"<- EMAIL GENERATOR -> ERROR: Failed to send to {recipient_email}: {error}")
+                    Metrics.increment('emails_failed')
+                    failed += 1
+                else:
+                    send_queue.mark_sent(company_name, recipient_email, response.get('id'))
+                    logging.info(f"Generated Email - Recipient: {recipient_email} | Subject: {email_subject}\nBody: {email_body}")
+                    print(f"<- EMAIL GENERATOR -> Email sent to {recipient_email}")
+                    Metrics.increment('emails_sent')
+                    sent += 1
+                backend.release_payload(message)
+            print(f"<- EMAIL GENERATOR -> Progress: {sent} sent, {failed} failed so far.")
+        if not total:
+            print("<- EMAIL GENERATOR -> No emails left to send.")
+        return {'total': total, 'sent': sent, 'failed': failed, 'skipped': skipped}
+
+    def compile_email_template(): # Compiles the message once and checks it against every company, so a bad placeholder stops the run before anything is sent
+        try:
+            email_template = EmailTemplate(data)
+        except ValueError as error:
+            print(f"<- EMAIL GENERATOR -> ERROR: {error}")
+            sys.exit()
+        def get_companies():
+            for company in iter_companies(data, shard):
+                company_name, company_logo_extension = os.path.splitext(company['logo'])
+                yield company_name, company.get('position', 'Senior Fullstack Developer'), company
+        errors = email_template.validate(get_companies())
+        if errors:
+            for error in errors:
+                print(f"<- EMAIL GENERATOR -> ERROR: Email template placeholder missing: {error}")
+            sys.exit()
+        return email_template
+
     # Start
     configure_logging()
-    minimum_interval = data.get('minimumInterval', 30)
-    maximum_interval = data.get('maximumInterval', 60)
-    email_interval_minimum, email_interval_maximum = configure_email_interval(minimum_interval, maximum_interval)
-    credentials = engage_email_authentication()
-    process_emails(credentials)
+    email_template = compile_email_template()
+    # Without rate limits of their own, campaigns keep the historical 30 to 60 minutes spacing
+    minimum_interval = data.get('minimumInterval', 0 if 'rateLimit' in data else 30)
+    maximum_interval = data.get('maximumInterval', 0 if 'rateLimit' in data else 60)
+    batch_configuration = data.get('batch')
+    if batch_configuration and data.get('smtp'):
+        print("<- EMAIL GENERATOR -> Batch mode is only available through the GMail API, spacing out the emails instead...")
+        batch_configuration = None
+    if not batch_configuration:
+        email_interval_minimum, email_interval_maximum = configure_email_interval(minimum_interval, maximum_interval)
+    manifest = load_manifest(pdf_folder)
+    send_queue = SendQueue()
+    rate_limit = dict(data.get('rateLimit', defaultLimits))
+    if batch_configuration and batch_configuration.get('perMinute'):
+        # The batch setting predates the rate limits: it replaces the default one, and the tightest of both applies otherwise
+        configured = rate_limit.get('perMinute') if 'rateLimit' in data else None
+        rate_limit['perMinute'] = min(batch_configuration['perMinute'], configured or batch_configuration['perMinute'])
+    # The emails sent within the last day, on previous runs too, count against the limits
+    sent_ages = send_queue.get_sent_ages()
+    rate_limiter, backoff = create_pacing(rate_limit, [time.monotonic() - age for age in sent_ages])
+    print(f"<- EMAIL GENERATOR -> Rate limits: {describe_limits(rate_limiter.limits)} ({len(sent_ages)} email(s) sent in the last day).")
+    # A single backend (and its connections) is shared by every email of the campaign
+    backend = engage_email_authentication()
+    process_emails()
     # End
\ No newline at end of file
@@ -1,170 +1,147 @@
 import os
 import sys
 import json
-import jsonschema
+import argparse
+import multiprocessing
 
-from jsonschema import validate
+import Metrics
 
 from Utils import get_integer_input
-from GenerateCV import generate_cv_for_companies
-from GenerateEmail import send_cv_email_to_companies
+from Validation import get_errors, get_content_hash, is_known_valid, remember_valid, output_profiles
+from CompanySource import parse_shard, iter_companies
 
 def load_data(json_file):
     try:
-        with open(json_file, 'r', encoding='utf-8') as file:
-            return json.load(file)
+        with open(json_file, 'rb') as file:
+            content = file.read()
+        return json.loads(content.decode('utf-8')), get_content_hash(content)
     except Exception as error:
         print(f"<- MAIN -> Error: {error}")
         sys.exit()
 
-def validate_data(data):
-    schema = {
-        "type": "object",
-        "properties": {
-            "minimumInterval": {"type": "integer"},
-            "maximumInterval": {"type": "integer"},
-            "message": {
-                "type": "object",
-                "properties": {
-                    "opening": {"type": "array", "items": {"type": "string"}},
-                    "constant": {"type": "array", "items": {"type": "string"}},
-                    "variable": {"type": "array", "items": {"type": "string"}},
-                    "ending": {"type": "array", "items": {"type": "string"}}
-                },
-                "required": ["opening", "constant", "variable", "ending"]
-            },
-            "companies": {
-                "type": "array",
-                "items": {
-                    "type": "object",
-                    "properties": {
-                        "logo": {"type": "string"},
-                        "email": {"type": "string", "format": "email"},
-                        "position": {"type": "string"}
-                    },
-                    "required": ["logo", "email", "position"]
-                }
-            },
-            "avatar": {"type": "string"},
-            "name": {"type": "string"},
-            "title": {"type": "string"},
-            "about": {"type": "array", "items": {"type": "string"}},
-            "contact": {
-                "type": "object",
-                "properties": {
-                    "address": {"type": "string"},
-                    "phone": {"type": "string"},
-                    "email": {"type": "string", "format": "email"},
-                    "linkedin": {"type": "string", "format": "uri"},
-                    "github": {"type": "string", "format": "uri"}
-                },
-                "required": ["address", "phone", "email", "linkedin", "github"]
-            },
-            "experience": {
-                "type": "array",
-                "items": {
-                    "type": "object",
-                    "properties": {
-                        "title": {"type": "string"},
-                        "team": {"type": "string"},
-                        "company": {"type": "string"},
-                        "date": {"type": "string"},
-                        "sectors": {"type": "array", "items": {"type": "string"}},
-                        "technologies": {"type": "array", "items": {"type": "string"}}
-                    },
-                    "required": ["title", "team", "company", "date", "sectors", "technologies"]
-                }
-            },
-            "education": {
-                "type": "array",
-                "items": {
-                    "type": "object",
-                    "properties": {
-                        "degree": {"type": "string"},
-                        "institution": {"type": "string"},
-                        "date": {"type": "string"}
-                    },
-                    "required": ["degree", "institution", "date"]
-                }
-            },
-            "certificates": {
-                "type": "array", 
-                "items": {
-                    "type": "object",
-                    "properties": {
-                        "name": {"type": "string"},
-                        "authority": {"type": "string"},
-                        "date": {"type": "string"}
-                    },
-                    "required": ["name", "authority", "date"]
-                }
-            },
-            "projects": {
-                "type": "array", 
-                "items": {
-                    "type": "object",
-                    "properties": {
-                        "title": {"type": "string"},
-                        "description": {
-                            "oneOf": [
-                                {   
-                                    "type": "string"
-                                },
-                                {
-                                    "type": "array",
-                                    "items": {"type": "string"}
-                                }
-                            ]
-                        }
-                    },
-                    "required": ["title", "description"]
-                }
-            },
-            "skills": {
-                "type": "object",
-                "properties": {
-                    "Technical": {
-                        "type": "object",
-                        "additionalProperties": {
-                            "type": "integer"
-                        }
-                    },
-                    "Leadership and Management": {
-                        "type": "object",
-                        "additionalProperties": {
-                            "type": "integer"
-                        }
-                    },
-                    "Soft": {
-                        "type": "object",
-                        "additionalProperties": {
-                            "type": "integer"
-                        }
-                    }
-                }
-            },
-            "languages": {
-                "type": "object",
-                "additionalProperties": {
-                    "type": "integer"
-                }
-            }
-        },
-        "required": ["message", "companies", "avatar", "name", "title", "about", "contact"]
-    }
-    try:
-        validate(instance=data, schema=schema)
-        print("<- MAIN -> Data is valid.")
-    except jsonschema.exceptions.ValidationError as error:
-        print(f"<- MAIN -> Data validation error: {error.message}")
+def validate_data(data, content_hash=None):
+    if content_hash and is_known_valid(content_hash):
+        Metrics.increment('validation_cache_hits')
+        print("<- MAIN -> Data is valid (unchanged since the last validation).")
+        return
+    with Metrics.span('validation'):
+        errors = get_errors(data)
+    if errors:
+        print(f"<- MAIN -> Data validation found {len(errors)} error(s):")
+        for error in errors:
+            print(f"\t{error}")
         sys.exit()
+    if content_hash:
+        remember_valid(content_hash)
+    print("<- MAIN -> Data is valid.")
 
-def main():
-    pdf_folder = 'output'
-    data = load_data('curriculum.json')
-    print(f"<- MAIN -> Analyzing your 'curriculum.json' data...")
-    validate_data(data)
-    
+def add_company_arguments(parser):
+    parser.add_argument('--companies', default=argparse.SUPPRESS, help="Read the target companies from a .jsonl, .csv or SQLite (.db, .sqlite) file instead of 'curriculum.json'")
+    parser.add_argument('--shard', type=parse_shard_argument, default=argparse.SUPPRESS, help='Only process the i-th of n shards of the companies (e.g. 1/4), to split the work across machines')
+
+def add_build_arguments(parser):
+    # Defaults are set once on the main parser, so options given before or after the command are both honoured
+    parser.add_argument('--workers', type=int, default=argparse.SUPPRESS, help='Number of processes used to render CVs in parallel (default: 1)')
+    parser.add_argument('--force', action='store_true', default=argparse.SUPPRESS, help='Render every CV again, even the ones whose inputs did not change')
+    parser.add_argument('--profile', action='store_true', default=argparse.SUPPRESS, help="Profile the render with cProfile and tracemalloc, the stats are saved to the 'metrics' folder")
+    parser.add_argument('--output-profile', choices=output_profiles, default=argparse.SUPPRESS, help="'compact' downsamples images for smaller attachments, 'print' keeps them at print resolution (default: the 'outputProfile' of the data, or print)")
+
+def add_send_arguments(parser):
+    parser.add_argument('--retry-failed', action='store_true', default=argparse.SUPPRESS, help='Send again the emails that failed on previous runs')
+    parser.add_argument('--sender', default=argparse.SUPPRESS, help="Sender email address, defaults to the one in 'curriculum.json' without asking")
+
+def add_watch_arguments(parser):
+    parser.add_argument('--interval', type=float, default=argparse.SUPPRESS, help='Seconds between two checks for changed files (default: 1)')
+    parser.add_argument('--debounce', type=float, default=argparse.SUPPRESS, help='Seconds the files must stay unchanged before rebuilding, so a burst of edits triggers a single build (default: 0.5)')
+
+def add_serve_arguments(parser):
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1, only this machine)')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on (default: 8080)')
+    parser.add_argument('--workers', type=int, default=argparse.SUPPRESS, help='Number of CVs rendered at the same time (default: 1)')
+    parser.add_argument('--cache-size', type=int, default=256, help='Number of rendered PDFs kept in memory (default: 256)')
+
+def parse_shard_argument(shard):
+    try:
+        return parse_shard(shard)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='JobFinder - Generate tailored CVs and send them to your target companies. Run without a command for the interactive menu.')
+    parser.add_argument('--data', default='curriculum.json', help="Path to the curriculum data (default: curriculum.json)")
+    parser.add_argument('--metrics', help='Write the time spent per stage and the counters to this file when finished, as Prometheus text for .prom/.txt files and JSON lines otherwise')
+    add_company_arguments(parser)
+    add_build_arguments(parser)
+    add_send_arguments(parser)
+    parser.set_defaults(companies=None, shard=None, workers=1, force=False, profile=False, output_profile=None, retry_failed=False, sender=None, interval=1.0, debounce=0.5)
+
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    build = commands.add_parser('build', help='Generate the CV PDF documents')
+    add_company_arguments(build)
+    add_build_arguments(build)
+    send = commands.add_parser('send', help='Send the CVs to all target companies')
+    add_company_arguments(send)
+    add_send_arguments(send)
+    everything = commands.add_parser('all', help='Generate the CVs and then send them')
+    add_company_arguments(everything)
+    add_build_arguments(everything)
+    add_send_arguments(everything)
+    watch = commands.add_parser('watch', help='Build the CVs and rebuild the changed ones whenever the data, the avatar or a logo changes')
+    add_company_arguments(watch)
+    add_build_arguments(watch)
+    add_watch_arguments(watch)
+    server = commands.add_parser('serve', help="Render CVs on request over HTTP, for other tools (doesn't read 'curriculum.json')")
+    add_serve_arguments(server)
+    status = commands.add_parser('status', help='Show the generated CVs and the state of the email campaign')
+    add_company_arguments(status)
+    return parser.parse_args()
+
+def generate_cvs(data, pdf_folder, arguments):
+    # Imported here so the commands that do not render PDFs never load reportlab
+    from GenerateCV import generate_cv_for_companies
+
+    print("<- MAIN -> Generating CVs...")
+    generate_cv_for_companies(data, pdf_folder, arguments.workers, arguments.force, arguments.profile, arguments.shard, arguments.output_profile)
+    print("<- MAIN -> Finished generating CVs!")
+
+def send_emails(data, pdf_folder, arguments, interactive=False):
+    from GenerateEmail import send_cv_email_to_companies, get_default_sender
+
+    print("<- MAIN -> Sending emails...")
+    # Only the interactive menu asks for the sender, commands use --sender or the configured address
+    email_sender = arguments.sender or (None if interactive else get_default_sender(data))
+    send_cv_email_to_companies(data, pdf_folder, arguments.retry_failed, email_sender, arguments.shard)
+    print("<- MAIN -> Finished processing emails!")
+
+def watch_cvs(data, pdf_folder, arguments):
+    from Watcher import watch_curriculum
+
+    print("<- MAIN -> Watching for changes...")
+    watch_curriculum(arguments.data, data, pdf_folder, arguments.workers, arguments.force, arguments.profile, arguments.shard, arguments.output_profile, arguments.companies, arguments.interval, arguments.debounce)
+
+def serve_cvs(arguments):
+    from Server import serve
+
+    serve(arguments.host, arguments.port, arguments.workers, arguments.cache_size)
+
+def print_status(data, pdf_folder, shard=None):
+    from Manifest import load_manifest, get_latest_cv
+    from SendQueue import SendQueue, queue_file
+
+    manifest = load_manifest(pdf_folder)
+    print(f"<- MAIN -> CVs in '{pdf_folder}':")
+    for company in iter_companies(data, shard):
+        company_name, company_logo_extension = os.path.splitext(company['logo'])
+        latest_cv = get_latest_cv(manifest, company_name)
+        print(f"\t{company_name}: {latest_cv or 'not generated'}")
+
+    if not os.path.exists(queue_file):
+        print("<- MAIN -> No email campaign started yet.")
+        return
+    counts = SendQueue().counts()
+    print(f"<- MAIN -> Email campaign: {', '.join(f'{count} {state}' for state, count in sorted(counts.items())) or 'empty'}.")
+
+def run_menu(data, pdf_folder, arguments):
     print(f"<- MAIN -> Welcome to JobFinder {data['name']}! Type the corresponding number in order to select an option.\n<- MAIN -> How may I assist you?");
     print("\t[1] Generate Curriculum Vitae PDF Documents")
     print("\t[2] Send Curriculum Vitae email to all target companies")
@@ -172,23 +149,56 @@ def main():
     choice = get_integer_input("Your choice: ")
 
     if choice==1 or choice == 3:
-        print("<- MAIN -> Generating CVs...")
-        generate_cv_for_companies(data, pdf_folder)
-        print("<- MAIN -> Finished generating CVs!")
+        generate_cvs(data, pdf_folder, arguments)
     if choice == 2 or choice == 3:
-        print("<- MAIN -> Sending emails...")
-        send_cv_email_to_companies(data, pdf_folder)
-        print("<- MAIN -> Finished processing emails!")
+        send_emails(data, pdf_folder, arguments, interactive=True)
     if choice not in [1,2,3]:
         print(f"<- FINISHED -> {data['name']}, you do not know how to read. Please do so before attempting to find a job. Aborting...")
-        
+
+def main(arguments):
+    pdf_folder = 'output'
+    if arguments.command == 'serve':
+        # Every request brings its own curriculum
+        serve_cvs(arguments)
+        return
+    data, content_hash = load_data(arguments.data)
+    if arguments.companies:
+        # The cached result only covers the file as written, so the overridden data is validated again
+        data['companySource'] = arguments.companies
+        content_hash = None
+    print(f"<- MAIN -> Analyzing your '{arguments.data}' data...")
+    validate_data(data, content_hash)
+
+    try:
+        if arguments.command is None:
+            run_menu(data, pdf_folder, arguments)
+        if arguments.command in ('build', 'all'):
+            generate_cvs(data, pdf_folder, arguments)
+        if arguments.command in ('send', 'all'):
+            send_emails(data, pdf_folder, arguments)
+        if arguments.command == 'watch':
+            watch_cvs(data, pdf_folder, arguments)
+        if arguments.command == 'status':
+            print_status(data, pdf_folder, arguments.shard)
+    finally:
+        # Exported even when the run is interrupted, the stages that completed are often the interesting ones
+        if arguments.metrics:
+            Metrics.print_summary()
+            Metrics.export(arguments.metrics)
+            print(f"<- MAIN -> Metrics written to {arguments.metrics}")
+
     print("<- FINISHED -> Thank you for using JobFinder!")
 
 if __name__ == "__main__":
+    # Required for the CV rendering process pool to work inside the PyInstaller executable
+    multiprocessing.freeze_support()
+    arguments = parse_arguments()
     try:
-        main()
+        main(arguments)
     except KeyboardInterrupt:
         print("\n<- FINISHED -> Process interrupted by the user. Thank you for using JobFinder!")
         sys.exit()
     finally:
-        os.system('pause')
\ No newline at end of file
+        # Keeps the window of the executable open, commands are meant for scripts and terminals so they exit right away
+        if arguments.command is None:
+            os.system('pause')
@@ -0,0 +1,101 @@
+import os
+import json
+import hashlib
+
+from datetime import datetime, timezone
+
+from Assets import get_file_hash
+
+# Keeps track of the inputs every CV in the output folder was rendered from
+manifest_name = 'manifest.json'
+
+# Configuration keys that only affect the emails, changing them must not trigger a rebuild
+email_only_keys = ('minimumInterval', 'maximumInterval', 'rateLimit', 'message', 'companies', 'companySource', 'smtp', 'batch')
+
+def load_manifest(pdf_folder):
+    manifest_path = os.path.join(pdf_folder, manifest_name)
+    if not os.path.exists(manifest_path):
+        return {'companies': {}}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+        manifest.setdefault('companies', {})
+        return manifest
+    except (OSError, ValueError) as error:
+        print(f"<- CV GENERATOR -> ERROR: Ignoring unreadable build manifest {manifest_path}: {error}")
+        return {'companies': {}}
+
+def save_manifest(pdf_folder, manifest):
+    os.makedirs(pdf_folder, exist_ok=True)
+    manifest_path = os.path.join(pdf_folder, manifest_name)
+    # Replaced atomically so an interrupted run never leaves a truncated manifest behind
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=4)
+    os.replace(temp_path, manifest_path)
+
+def get_base_hash(data, template_version=''):
+    """
+    Hashes every input shared by all the CVs: the curriculum content, the avatar and the template.
+
+    Parameters:
+    data (dict): The curriculum data.
+    template_version (str): The version of the template used to render.
+
+    Returns:
+    str: The hex digest of the shared inputs.
+    """
+    digest = hashlib.sha256()
+    curriculum = {key: value for key, value in data.items() if key not in email_only_keys}
+    digest.update(json.dumps(curriculum, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    avatar = data.get('avatar', '')
+    if avatar and os.path.exists(avatar):
+        digest.update(get_file_hash(avatar).encode('ascii'))
+    digest.update(str(template_version).encode('utf-8'))
+    return digest.hexdigest()
+
+def get_company_hash(base_hash, company_logo_path='', content_key=''):
+    digest = hashlib.sha256(base_hash.encode('ascii'))
+    if company_logo_path:
+        digest.update(company_logo_path.encode('utf-8'))
+        digest.update(get_file_hash(company_logo_path).encode('ascii'))
+    if content_key:
+        # CVs tailored to a job description also depend on the items picked for it
+        digest.update(content_key.encode('utf-8'))
+    return digest.hexdigest()
+
+def is_up_to_date(manifest, company_name, company_hash):
+    entry = manifest['companies'].get(company_name)
+    return bool(entry) and entry.get('hash') == company_hash and os.path.exists(entry.get('path', ''))
+
+def record_build(manifest, company_name, company_hash, pdf_path):
+    previous_path = manifest['companies'].get(company_name, {}).get('path')
+    # CVs keep their name across rebuilds, the previous path only differs when a locked PDF got a GUID suffixed name.
+    # The CV it replaces is then removed, so the output folder keeps a single CV per company.
+    if previous_path and os.path.abspath(previous_path) != os.path.abspath(pdf_path):
+        try:
+            os.remove(previous_path)
+        except OSError:
+            # Already deleted, or still open in a PDF viewer
+            pass
+    manifest['companies'][company_name] = {
+        'hash': company_hash,
+        'path': pdf_path,
+        'createdAt': datetime.now(timezone.utc).isoformat(timespec='seconds')
+    }
+
+def get_latest_cv(manifest, company_name):
+    """
+    Looks up the most recent CV built for a company in the build manifest.
+
+    Parameters:
+    manifest (dict): The manifest returned by load_manifest.
+    company_name (str): The company name, as parsed from its logo filename.
+
+    Returns:
+    str: The path to the most recent CV, or None when it is not indexed or no longer exists.
+    """
+    entry = manifest['companies'].get(company_name)
+    if entry and os.path.exists(entry.get('path', '')):
+        return entry['path']
+    return None
@@ -0,0 +1,144 @@
+import io
+import os
+import json
+import time
+import threading
+
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Stages are always timed, recording a span only costs two perf_counter calls, and only exported when asked for
+# Long running commands (watch, serve) only keep the latest events, the per stage totals keep counting everything
+events = deque(maxlen=100000)
+stages = {}
+counters = {}
+lock = threading.Lock()
+
+def observe(name, seconds, **labels):
+    """
+    Records the duration of a stage measured elsewhere, e.g. in a worker process.
+
+    Parameters:
+    name (str): The stage name, e.g. 'doc_build'.
+    seconds (float): How long the stage took.
+    labels: Details stored with the event (e.g. company='GitHub'), not used to aggregate.
+    """
+    with lock:
+        events.append({'type': 'span', 'name': name, 'seconds': seconds, 'at': datetime.now(timezone.utc).isoformat(timespec='milliseconds'), **labels})
+        count, total, maximum = stages.get(name, (0, 0.0, 0.0))
+        stages[name] = (count + 1, total + seconds, max(maximum, seconds))
+
+@contextmanager
+def span(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+def increment(name, value=1):
+    with lock:
+        counters[name] = counters.get(name, 0) + value
+
+def reset():
+    with lock:
+        events.clear()
+        stages.clear()
+        counters.clear()
+
+def get_summary():
+    with lock:
+        return {
+            'stages': {name: {'count': count, 'seconds': total, 'maxSeconds': maximum} for name, (count, total, maximum) in stages.items()},
+            'counters': dict(counters)
+        }
+
+def to_json_lines():
+    with lock:
+        lines = [json.dumps(event) for event in events]
+        lines += [json.dumps({'type': 'counter', 'name': name, 'value': value}) for name, value in counters.items()]
+    return '\n'.join(lines) + '\n'
+
+def to_prometheus():
+    # Text exposition format, e.g. for the node exporter's textfile collector
+    summary = get_summary()
+    lines = [
+        '# HELP jobfinder_stage_seconds Time spent in each stage.',
+        '# TYPE jobfinder_stage_seconds summary'
+    ]
+    for name, stage in sorted(summary['stages'].items()):
+        lines.append(f'jobfinder_stage_seconds_count{{stage="{name}"}} {stage["count"]}')
+        lines.append(f'jobfinder_stage_seconds_sum{{stage="{name}"}} {stage["seconds"]:.6f}')
+    lines += [
+        '# HELP jobfinder_stage_max_seconds Slowest run of each stage.',
+        '# TYPE jobfinder_stage_max_seconds gauge'
+    ]
+    for name, stage in sorted(summary['stages'].items()):
+        lines.append(f'jobfinder_stage_max_seconds{{stage="{name}"}} {stage["maxSeconds"]:.6f}')
+    for name, value in sorted(summary['counters'].items()):
+        lines.append(f'# TYPE jobfinder_{name}_total counter')
+        lines.append(f'jobfinder_{name}_total {value}')
+    return '\n'.join(lines) + '\n'
+
+def export(path):
+    """
+    Writes the recorded metrics, as Prometheus text when the file ends in .prom or .txt, as JSON lines otherwise.
+
+    Parameters:
+    path (str): The file to write to.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    content = to_prometheus() if path.endswith(('.prom', '.txt')) else to_json_lines()
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(content)
+
+def print_summary(context='<- MAIN ->'):
+    summary = get_summary()
+    if not summary['stages']:
+        return
+    print(f"{context} Time per stage:")
+    for name, stage in sorted(summary['stages'].items(), key=lambda item: -item[1]['seconds']):
+        print(f"\t{name}: {stage['seconds']:.2f}s over {stage['count']} run(s), slowest {stage['maxSeconds']:.3f}s")
+
+@contextmanager
+def profile(name, folder='metrics', limit=15):
+    """
+    Profiles a single block with cProfile and tracemalloc, e.g. one CV render.
+
+    Saves the cProfile stats to '<folder>/<name>.prof' (open it with snakeviz or pstats) and prints the slowest
+    functions and the lines that allocated the most memory.
+
+    Parameters:
+    name (str): Used in the output filename.
+    folder (str): The folder the stats are written to.
+    limit (int): How many functions and allocation sites are printed.
+    """
+    # Only imported when profiling, they would otherwise slow down every start
+    import pstats
+    import cProfile
+    import tracemalloc
+
+    os.makedirs(folder, exist_ok=True)
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        profile_path = os.path.join(folder, f"{name}.prof")
+        profiler.dump_stats(profile_path)
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(limit)
+        print(f"<- PROFILER -> {name}: peak memory {peak / 1024 / 1024:.1f} MB, stats saved to {profile_path}")
+        print(report.getvalue())
+        print(f"<- PROFILER -> Top {limit} allocations:")
+        for statistic in snapshot.statistics('lineno')[:limit]:
+            print(f"\t{statistic}")
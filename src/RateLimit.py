@@ -0,0 +1,216 @@
+import time
+import random
+import threading
+
+from collections import deque
+
+# Length in seconds of the window of every supported limit
+windows = {'perMinute': 60, 'perHour': 3600, 'perDay': 86400}
+
+# Applied when curriculum.json has no 'rateLimit', below the daily cap of a personal GMail account
+defaultLimits = {'perMinute': 20, 'perDay': 500}
+
+# Gmail API reasons of the 403 errors that are quota errors rather than permission errors
+quota_reasons = ('rateLimitExceeded', 'userRateLimitExceeded', 'dailyLimitExceeded', 'quotaExceeded')
+
+# SMTP replies of servers throttling the sender (service unavailable, greylisting, too many messages)
+smtp_throttle_codes = (421, 450, 451, 452)
+
+class RateLimiter:
+    """
+    Token bucket per configured window: each bucket holds up to its limit of sends, and every token spent comes back
+    one window later. Bursts go out right away, a campaign runs as fast as the tightest limit allows, and no rolling
+    window (e.g. any 24 hours for the daily cap) ever holds more sends than its limit, which a bucket refilling at a
+    constant rate would allow.
+
+    Every method takes an optional 'now' so timetables can be planned ahead on a simulated clock.
+    """
+    def __init__(self, limits=None, clock=time.monotonic, history=()):
+        """
+        Parameters:
+        limits (dict): The 'perMinute', 'perHour' and 'perDay' limits, missing or empty ones are unlimited.
+        clock (callable): Returns the current time in seconds.
+        history (iterable): The clock times of sends made before the limiter was created (e.g. by a previous run),
+                            they take their tokens so the limits hold across runs.
+        """
+        self.clock = clock
+        self.limits = {name: limit for name, limit in (limits or {}).items() if name in windows and limit}
+        self.lock = threading.Lock()
+        # [limit, window, (time, count) of the tokens spent within the window, tokens spent]
+        self.buckets = [[limit, windows[name], deque(), 0] for name, limit in self.limits.items()]
+        # Set after the server throttled the sender, nothing is sent before
+        self.resume_at = None
+        for sent_at in sorted(history):
+            self.consume(1, sent_at)
+
+    @property
+    def capacity(self):
+        # The most sends that can ever go out at once, None when unlimited
+        return min((bucket[0] for bucket in self.buckets), default=None)
+
+    def refill(self, now):
+        for bucket in self.buckets:
+            spent = bucket[2]
+            while spent and now - spent[0][0] >= bucket[1]:
+                bucket[3] -= spent.popleft()[1]
+
+    def consume(self, count, now):
+        for bucket in self.buckets:
+            bucket[2].append((now, count))
+            bucket[3] += count
+
+    def get_delay(self, count=1, now=None):
+        """
+        Returns the seconds to wait before 'count' sends fit within every limit, 0 when they can go out right away.
+        """
+        with self.lock:
+            now = self.clock() if now is None else now
+            self.refill(now)
+            delay = max(0.0, self.resume_at - now) if self.resume_at is not None else 0.0
+            for limit, window, spent, used in self.buckets:
+                # Waits for enough of the oldest tokens to come back
+                missing = used + min(count, limit) - limit
+                for sent_at, sent in spent:
+                    if missing <= 0:
+                        break
+                    missing -= sent
+                    delay = max(delay, sent_at + window - now)
+            return delay
+
+    def acquire(self, count=1, now=None):
+        # Takes the tokens of 'count' sends, callers wait for get_delay first
+        with self.lock:
+            now = self.clock() if now is None else now
+            self.refill(now)
+            self.consume(count, now)
+
+    def wait(self, count=1):
+        while True:
+            delay = self.get_delay(count)
+            if delay <= 0:
+                break
+            time.sleep(delay)
+        self.acquire(count)
+
+    def simulate(self):
+        # Copy of the current state on a clock starting at 0, so a timetable can be planned without waiting
+        with self.lock:
+            now = self.clock()
+            self.refill(now)
+            simulation = RateLimiter(clock=lambda: 0.0)
+            simulation.limits = dict(self.limits)
+            simulation.buckets = [[limit, window, deque((sent_at - now, sent) for sent_at, sent in spent), used] for limit, window, spent, used in self.buckets]
+            simulation.resume_at = self.resume_at - now if self.resume_at is not None else None
+        return simulation
+
+    def throttle(self, delay, now=None):
+        # The server rejected a send for going over its quota: every send waits for the delay, not only the rejected one
+        with self.lock:
+            resume_at = (self.clock() if now is None else now) + delay
+            self.resume_at = max(self.resume_at or resume_at, resume_at)
+
+def get_status(error):
+    # HTTP status of Google API errors, SMTP reply code of smtplib errors
+    response = getattr(error, 'resp', None)
+    if response is not None:
+        return getattr(response, 'status', None)
+    return getattr(error, 'smtp_code', None)
+
+def is_quota_error(error):
+    """
+    Tells whether a send failed because the server is throttling the sender, so it is worth sending again later.
+
+    Parameters:
+    error (Exception): The error raised by a backend's send, or returned for a message of a batch.
+
+    Returns:
+    bool: Whether the error is a 429, a quota 403 or a throttling SMTP reply.
+    """
+    status = get_status(error)
+    if status is not None:
+        status = int(status)
+    if status == 429:
+        return True
+    if status == 403:
+        return any(reason in str(error) for reason in quota_reasons)
+    return getattr(error, 'smtp_code', None) in smtp_throttle_codes
+
+def get_retry_after(error):
+    # Seconds the server asked to wait before sending again, when it said so
+    response = getattr(error, 'resp', None)
+    try:
+        return float(response.get('retry-after')) if response is not None and response.get('retry-after') else None
+    except (TypeError, ValueError):
+        return None
+
+class Backoff:
+    """
+    Jittered exponential backoff: retry n waits a random delay between 0 and min(maximum, base * 2^n) seconds
+    (or longer when the server asked for it), so throttled senders don't all come back at the same time.
+    """
+    def __init__(self, retries=5, base=2.0, maximum=600.0, rate_limiter=None, context='<- EMAIL GENERATOR ->'):
+        self.retries = retries
+        self.base = base
+        self.maximum = maximum
+        self.rate_limiter = rate_limiter
+        self.context = context
+
+    def get_delay(self, attempt, error=None):
+        delay = random.uniform(0, min(self.maximum, self.base * 2 ** attempt))
+        retry_after = get_retry_after(error) if error is not None else None
+        return max(delay, retry_after) if retry_after else delay
+
+    def on_quota_error(self, attempt, error):
+        # Returns the seconds to wait before retrying, None once the retries are exhausted.
+        # The following sends are held back as well, for the longest delay once the retries are exhausted.
+        exhausted = attempt >= self.retries
+        delay = max(self.maximum, get_retry_after(error) or 0) if exhausted else self.get_delay(attempt, error)
+        if self.rate_limiter:
+            self.rate_limiter.throttle(delay)
+        if exhausted:
+            return None
+        print(f"{self.context} Throttled by the server ({error}), retrying in {delay:.1f}s ({attempt + 1}/{self.retries})...")
+        return delay
+
+    def call(self, function, *args):
+        """
+        Calls a function, calling it again after a jittered delay every time it fails with a quota error.
+
+        Returns:
+        The result of the function, the last error is raised once the retries are exhausted.
+        """
+        attempt = 0
+        while True:
+            try:
+                return function(*args)
+            except Exception as error:
+                if not is_quota_error(error):
+                    raise
+                delay = self.on_quota_error(attempt, error)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+
+def create_pacing(configuration=None, history=()):
+    """
+    Builds the rate limiter and the backoff of a campaign from the 'rateLimit' settings of curriculum.json.
+
+    Parameters:
+    configuration (dict): The 'perMinute', 'perHour', 'perDay' limits and the 'retries', 'backoff' (base seconds)
+                          and 'maximumBackoff' settings, the default limits when None.
+    history (iterable): The time.monotonic times of the emails already sent within the last day.
+
+    Returns:
+    tuple: The RateLimiter and the Backoff.
+    """
+    configuration = defaultLimits if configuration is None else configuration
+    rate_limiter = RateLimiter(configuration, history=history)
+    backoff = Backoff(configuration.get('retries', 5), configuration.get('backoff', 2.0), configuration.get('maximumBackoff', 600.0), rate_limiter)
+    return rate_limiter, backoff
+
+def describe_limits(limits):
+    return ', '.join(f"{limit} per {name[len('per'):].lower()}" for name, limit in limits.items()) or 'no limit'
+
+def format_delay(seconds):
+    return f"{seconds:.0f} seconds" if seconds < 120 else f"{round(seconds / 60)} minutes"
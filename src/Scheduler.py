@@ -0,0 +1,179 @@
+import time
+import random
+import asyncio
+
+from datetime import datetime, timedelta
+
+from RateLimit import format_delay
+
+def plan_send_offsets(count, minimum_interval, maximum_interval, rate_limiter=None):
+    """
+    Works out the whole randomized timetable before the first email is sent.
+
+    Parameters:
+    count (int): The number of emails to send.
+    minimum_interval (float): The minimum amount of minutes between two emails, 0 for no spacing.
+    maximum_interval (float): The maximum amount of minutes between two emails.
+    rate_limiter (RateLimiter): The limits the emails are sent under, including the emails they already count.
+
+    Returns:
+    list: The offset in seconds from the start of the run at which each email is sent.
+    """
+    offsets = []
+    offset = 0
+    # The limits are planned on a copy of the limiter running on the timetable instead of the clock
+    planner = rate_limiter.simulate() if rate_limiter else None
+    for index in range(count):
+        # Doesn't wait an interval on the first email
+        if index:
+            offset += random.uniform(minimum_interval, maximum_interval) * 60
+        if planner:
+            # Pushed back further when sending it at that time would go over a limit
+            offset += planner.get_delay(now=offset)
+            planner.acquire(now=offset)
+        offsets.append(offset)
+    return offsets
+
+class SendScheduler:
+    """
+    Sends a list of jobs at randomized times without blocking on time.sleep.
+
+    Every job is a (name, prepare, send) tuple. The prepare callables run in the background, a few jobs ahead of the
+    one being sent, so messages are built and encoded while waiting without spooling the whole campaign to disk, and
+    each send fires at its scheduled time with whatever its prepare returned (jobs whose prepare returns None are
+    skipped). Messages prepared but never sent, e.g. when the run is interrupted, are handed to release. With a rate
+    limiter, every send also waits for the limiter, which only holds it back further when throttled sends pushed the
+    timetable back.
+    """
+    def __init__(self, jobs, minimum_interval, maximum_interval, context='<- EMAIL GENERATOR ->', rate_limiter=None, release=None, prepare_ahead=4):
+        self.jobs = jobs
+        self.context = context
+        self.rate_limiter = rate_limiter
+        self.release = release
+        self.prepare_ahead = prepare_ahead
+        self.offsets = plan_send_offsets(len(jobs), minimum_interval, maximum_interval, rate_limiter)
+        self.started_at = datetime.now()
+        self.started_monotonic = time.monotonic()
+        self.prepared = 0
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        self.next_send_at = None
+
+    def get_send_time(self, index):
+        return self.started_at + timedelta(seconds=self.offsets[index])
+
+    def give_up_slot(self, index):
+        # A job that will not be sent hands its slot over to the next one, so no time is spent waiting for nothing
+        if index + 1 < len(self.offsets):
+            gap = self.offsets[index + 1] - self.offsets[index]
+            for later in range(index + 1, len(self.offsets)):
+                self.offsets[later] -= gap
+
+    def progress(self):
+        return {
+            'total': len(self.jobs),
+            'prepared': self.prepared,
+            'sent': self.sent,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'nextSendAt': self.next_send_at.isoformat(timespec='seconds') if self.next_send_at else None
+        }
+
+    def print_timetable(self):
+        print(f"{self.context} Scheduled {len(self.jobs)} email(s):")
+        for index, (name, _, _) in enumerate(self.jobs):
+            print(f"\t{self.get_send_time(index).strftime('%Y-%m-%d %H:%M')} - {name}")
+
+    def print_progress(self):
+        progress = self.progress()
+        print(f"{self.context} Progress: {progress['sent']} sent, {progress['failed']} failed, {progress['skipped']} skipped out of {progress['total']} ({progress['prepared']} prepared).")
+
+    async def prepare_all(self, prepared_messages, window):
+        # Sequential on purpose: it only has to stay ahead of the schedule, which is minutes apart
+        for index, (name, prepare, _) in enumerate(self.jobs):
+            # A slot of the window is given back once the job is done with
+            await window.acquire()
+            preparation = asyncio.ensure_future(asyncio.to_thread(prepare))
+            try:
+                prepared_messages[index].set_result(await asyncio.shield(preparation))
+            except asyncio.CancelledError:
+                # The preparing thread can't be interrupted, its message is still kept so it gets released
+                message = (await asyncio.gather(preparation, return_exceptions=True))[0]
+                if not isinstance(message, BaseException):
+                    prepared_messages[index].set_result(message)
+                raise
+            except Exception as error:
+                prepared_messages[index].set_exception(error)
+            self.prepared += 1
+
+    def release_unsent(self, prepared_messages):
+        for prepared_message in prepared_messages:
+            if prepared_message.done() and not prepared_message.cancelled() and prepared_message.exception() is None:
+                message = prepared_message.result()
+                if message is not None and self.release:
+                    self.release(message)
+
+    async def run(self):
+        self.print_timetable()
+        loop = asyncio.get_running_loop()
+        prepared_messages = [loop.create_future() for _ in self.jobs]
+        window = asyncio.Semaphore(self.prepare_ahead)
+        preparing = asyncio.create_task(self.prepare_all(prepared_messages, window))
+        # Messages of the jobs from this one on were not handed over to their send
+        unsent = 0
+
+        try:
+            for index, (name, _, send) in enumerate(self.jobs):
+                try:
+                    # Messages are usually prepared long before their turn, this only waits when preparing falls behind
+                    try:
+                        message = await prepared_messages[index]
+                        if message is None:
+                            self.skipped += 1
+                            self.give_up_slot(index)
+                            continue
+                    except Exception as error:
+                        print(f"{self.context} ERROR: Failed to prepare the email for {name}: {error}")
+                        self.failed += 1
+                        self.give_up_slot(index)
+                        continue
+
+                    self.next_send_at = self.get_send_time(index)
+                    delay = self.started_monotonic + self.offsets[index] - time.monotonic()
+                    if delay > 0:
+                        print(f"{self.context} Waiting {format_delay(delay)} before sending the next email ({name} at {self.next_send_at.strftime('%H:%M')})...")
+                        await asyncio.sleep(delay)
+                    if self.rate_limiter:
+                        while (delay := self.rate_limiter.get_delay()) > 0:
+                            # The timetable already honours the limits, they only hold a send back after the server throttled the sender
+                            if delay >= 1:
+                                print(f"{self.context} Rate limit reached, waiting {format_delay(delay)} before sending the next email ({name})...")
+                            await asyncio.sleep(delay)
+                        self.rate_limiter.acquire()
+
+                    # From here on the send owns the message and releases it
+                    unsent = index + 1
+                    try:
+                        await asyncio.to_thread(send, message)
+                        self.sent += 1
+                    except Exception as error:
+                        print(f"{self.context} ERROR: {error}")
+                        self.failed += 1
+                    self.print_progress()
+                finally:
+                    window.release()
+
+            self.next_send_at = None
+            await preparing
+        finally:
+            preparing.cancel()
+            await asyncio.gather(preparing, return_exceptions=True)
+            # Messages spooled for jobs that were never sent (an interrupted run resumes from the send queue)
+            self.release_unsent(prepared_messages[unsent:])
+        print(f"{self.context} Finished the schedule.")
+        self.print_progress()
+        return self.progress()
+
+    def start(self):
+        return asyncio.run(self.run())
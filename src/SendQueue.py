@@ -0,0 +1,100 @@
+import os
+import sqlite3
+
+from datetime import datetime, timezone
+
+# Durable record of every email of the campaign, so an interrupted run resumes where it stopped
+queue_file = os.path.join('mail', 'queue.db')
+
+class SendQueue:
+    """
+    SQLite backed queue tracking the state of the email sent to each company.
+
+    States: 'pending' (not sent yet), 'sending' (handed over to the email API), 'sent', 'failed' and 'skipped' (no CV found).
+    A new connection is opened for every operation so the queue can be updated from the scheduler's worker threads.
+    """
+    def __init__(self, path=queue_file):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS emails (
+                    company TEXT NOT NULL,
+                    email TEXT NOT NULL,
+                    position TEXT,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    message_id TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    updated_at TEXT,
+                    PRIMARY KEY (company, email)
+                )
+            """)
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def update(self, company, email, state, **fields):
+        columns = ', '.join(f"{column} = ?" for column in fields)
+        assignments = f"state = ?, updated_at = ?{', ' + columns if columns else ''}"
+        values = [state, datetime.now(timezone.utc).isoformat(timespec='seconds'), *fields.values(), company, email]
+        with self.connect() as connection:
+            connection.execute(f"UPDATE emails SET {assignments} WHERE company = ? AND email = ?", values)
+
+    def sync(self, companies):
+        # Registers new companies as pending, the ones already in the queue keep their state
+        with self.connect() as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO emails (company, email, position) VALUES (?, ?, ?)",
+                ((company_name, email, position) for company_name, email, position in companies)
+            )
+            # Whether an email handed to the API right before a crash went out is unknown, it's left for the user to retry
+            interrupted = connection.execute("UPDATE emails SET state = 'failed', error = 'Interrupted while sending' WHERE state = 'sending'").rowcount
+        return interrupted
+
+    def retry_failed(self):
+        with self.connect() as connection:
+            return connection.execute("UPDATE emails SET state = 'pending' WHERE state = 'failed'").rowcount
+
+    def reset(self):
+        with self.connect() as connection:
+            connection.execute("DELETE FROM emails")
+
+    def get_state(self, company, email):
+        with self.connect() as connection:
+            row = connection.execute("SELECT state FROM emails WHERE company = ? AND email = ?", (company, email)).fetchone()
+        return row[0] if row else None
+
+    def should_send(self, company, email):
+        # Skipped companies are attempted again since their CV may exist by now
+        return self.get_state(company, email) in ('pending', 'skipped')
+
+    def mark_sending(self, company, email):
+        with self.connect() as connection:
+            connection.execute(
+                "UPDATE emails SET state = 'sending', attempts = attempts + 1, updated_at = ? WHERE company = ? AND email = ?",
+                (datetime.now(timezone.utc).isoformat(timespec='seconds'), company, email)
+            )
+
+    def mark_sent(self, company, email, message_id=None):
+        self.update(company, email, 'sent', message_id=message_id, error=None)
+
+    def mark_failed(self, company, email, error):
+        self.update(company, email, 'failed', error=str(error))
+
+    def mark_skipped(self, company, email):
+        self.update(company, email, 'skipped')
+
+    def get_sent_ages(self, window=86400):
+        # Seconds since every email sent within the window, so the rate limits also count the emails of previous runs
+        now = datetime.now(timezone.utc)
+        since = datetime.fromtimestamp(now.timestamp() - window, timezone.utc).isoformat(timespec='seconds')
+        with self.connect() as connection:
+            rows = connection.execute("SELECT updated_at FROM emails WHERE state = 'sent' AND updated_at >= ?", (since,)).fetchall()
+        return [(now - datetime.fromisoformat(updated_at)).total_seconds() for updated_at, in rows]
+
+    def counts(self):
+        with self.connect() as connection:
+            return dict(connection.execute("SELECT state, COUNT(*) FROM emails GROUP BY state").fetchall())
@@ -0,0 +1,267 @@
+import os
+import json
+import time
+import tempfile
+import threading
+
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from GenerateCV import image_extensions
+from Manifest import get_base_hash, get_company_hash
+from Tailoring import KeywordIndex
+from TemplateRegistry import defaultTemplate, defaultOutputProfile, pageSizes, get_template, is_two_phase, call, get_variants
+from Validation import get_render_errors, get_render_validator
+
+logo_folder = 'logos'
+# Requests name their avatar by file name, it is only ever read from this folder
+avatar_folder = 'avatars'
+
+# Base layouts kept by each render worker, companies sharing a curriculum then only get their watermark stamped
+base_pdf_cache = OrderedDict()
+base_pdf_cache_size = 16
+
+class ServiceBusy(Exception):
+    pass
+
+def render_pdf(cv_data, company_logo_path, variant, output_profile, base_key):
+    """
+    Renders a single CV and returns its bytes. Runs in the render pool, so it is kept at module level to be pickled.
+
+    Parameters:
+    cv_data (dict): The curriculum data, already tailored to the company.
+    company_logo_path (str): The path to the company logo, no watermark when empty.
+    variant (tuple): The (template, page size) names.
+    output_profile (str): One of the output profiles.
+    base_key (str): Hash of the inputs of the base layout, under which it is cached.
+
+    Returns:
+    bytes: The PDF.
+    """
+    template_name, page_size_name = variant
+    template = get_template(template_name)
+    options = {'output_profile': output_profile, 'page_size': pageSizes[page_size_name]}
+    with tempfile.TemporaryDirectory(prefix='jobfinder_serve_') as folder:
+        output_path = os.path.join(folder, 'curriculum.pdf')
+        if is_two_phase(template):
+            if base_key in base_pdf_cache:
+                base_pdf_cache.move_to_end(base_key)
+            else:
+                base_pdf_cache[base_key] = call(template, 'generate_base_pdf', cv_data, **options)
+                if len(base_pdf_cache) > base_pdf_cache_size:
+                    base_pdf_cache.popitem(last=False)
+            written_path = call(template, 'stamp_watermark', base_pdf_cache[base_key], output_path, company_logo_path, **options)
+        else:
+            written_path = call(template, 'generate_pdf_from_json', output_path, cv_data, company_logo_path, **options)
+        with open(written_path, 'rb') as file:
+            return file.read()
+
+def resolve_image(name, folder, kind):
+    """
+    Resolves an image named by a request to its file in a fixed folder. Requests never give a path, so they can't
+    read (nor probe for) any other file of the server, and the file is checked before anything reads it.
+
+    Parameters:
+    name (str): The file name given by the request.
+    folder (str): The only folder the image can be read from.
+    kind (str): What the image is, for the error messages.
+
+    Returns:
+    str: The path to the image.
+    """
+    if os.path.basename(name) != name or name in ('.', '..') or not name.lower().endswith(image_extensions):
+        raise ValueError(f"Invalid {kind} '{name}', expected the name of an image file of the '{folder}' folder.")
+    path = f"{folder}/{name}"
+    if not os.path.isfile(path):
+        raise ValueError(f"{kind.capitalize()} '{name}' not found in the '{folder}' folder.")
+    return path
+
+def warm_up():
+    # Nothing is returned, a template module can't be sent back from a worker process
+    get_template(defaultTemplate)
+
+def get_percentile(values, percentile):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(percentile / 100 * (len(ordered) - 1)))] if ordered else None
+
+class RenderService:
+    """
+    Renders CVs on request, keeping the templates and their caches warm between requests.
+
+    Rendered PDFs are kept in an LRU cache keyed by the hash of every input (the CV content, avatar, logo, layout and
+    tailoring), identical requests arriving together are rendered once, and renders run on a bounded pool: when every
+    worker is busy and the queue is full, requests are turned away instead of piling up.
+    """
+    def __init__(self, workers=1, cache_size=256, queue_size=None):
+        # Rendering is CPU bound, so concurrent renders need processes. A single worker renders in this process.
+        self.executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else ThreadPoolExecutor(max_workers=1)
+        # Every worker is started and imports the default template up front, so the first requests don't pay for loading reportlab
+        wait([self.executor.submit(warm_up) for _ in range(workers)])
+        get_render_validator()
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.in_flight = {}
+        self.slots = threading.BoundedSemaphore(queue_size or workers * 4)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Latest request durations, in seconds, of the cache hits and misses
+        self.latencies = {'hit': deque(maxlen=10000), 'miss': deque(maxlen=10000)}
+
+    def render(self, request):
+        """
+        Renders the CV described by a request, or fetches it from the cache.
+
+        Parameters:
+        request (dict): A request valid against Validation.render_schema: the 'curriculum' (its 'avatar' file name in
+                        the avatars folder), an optional 'company' (its 'logo' file name in the logos folder,
+                        'jobDescription' text, 'template' and 'pageSize') and an optional 'outputProfile'.
+
+        Returns:
+        tuple: The PDF bytes and whether it was a cache 'hit' or 'miss'.
+        """
+        curriculum = request['curriculum']
+        company = request.get('company') or {}
+        # Only the first layout of the company is rendered, one PDF per request
+        variant = get_variants(curriculum, company)[0]
+        template = get_template(variant[0])
+        output_profile = request.get('outputProfile') or curriculum.get('outputProfile', defaultOutputProfile)
+
+        # Checked before hashing, which reads the images
+        if curriculum.get('avatar'):
+            curriculum = {**curriculum, 'avatar': resolve_image(curriculum['avatar'], avatar_folder, 'avatar')}
+        company_logo_path = resolve_image(company['logo'], logo_folder, 'logo') if company.get('logo') else ''
+
+        # The job description is only taken as text, a service never reads the files it names
+        content_key, cv_data = '', curriculum
+        if company.get('jobDescription'):
+            content_key, cv_data = KeywordIndex(curriculum).tailor(company['jobDescription'], curriculum.get('tailoring'))
+
+        # Same hashes as the build manifest
+        base_hash = get_base_hash(curriculum, f"{variant[0]}/{getattr(template, 'templateVersion', '')}/{variant[1]}/{output_profile}")
+        base_key = get_company_hash(base_hash, '', content_key)
+        key = get_company_hash(base_hash, company_logo_path, content_key)
+
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return self.cache[key], 'hit'
+            self.misses += 1
+            future = self.in_flight.get(key)
+            if future is None:
+                if not self.slots.acquire(blocking=False):
+                    raise ServiceBusy('Every render worker is busy, retry later.')
+                future = self.executor.submit(render_pdf, cv_data, company_logo_path, variant, output_profile, base_key)
+                future.add_done_callback(lambda _: self.slots.release())
+                self.in_flight[key] = future
+        try:
+            pdf = future.result()
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+        with self.lock:
+            self.cache[key] = pdf
+            self.cache.move_to_end(key)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return pdf, 'miss'
+
+    def record(self, cache_state, seconds):
+        with self.lock:
+            self.latencies[cache_state].append(seconds)
+
+    def get_stats(self):
+        with self.lock:
+            latencies = {state: list(values) for state, values in self.latencies.items()}
+            stats = {'cache': {'entries': len(self.cache), 'size': self.cache_size, 'hits': self.hits, 'misses': self.misses}}
+        stats['latencyMs'] = {
+            state: {
+                'count': len(values),
+                'p50': round(get_percentile(values, 50) * 1000, 2) if values else None,
+                'p99': round(get_percentile(values, 99) * 1000, 2) if values else None
+            } for state, values in latencies.items()
+        }
+        return stats
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+def create_handler(service):
+    class RenderHandler(BaseHTTPRequestHandler):
+        def send_json(self, status, content):
+            body = json.dumps(content).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self.send_json(200, {'status': 'ok', **service.get_stats()})
+            else:
+                self.send_json(404, {'error': f"Unknown path '{self.path}', use POST /render or GET /health."})
+
+        def do_POST(self):
+            if self.path != '/render':
+                self.send_json(404, {'error': f"Unknown path '{self.path}', use POST /render or GET /health."})
+                return
+            start = time.perf_counter()
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+            except ValueError as error:
+                self.send_json(400, {'error': f"Invalid JSON: {error}"})
+                return
+            errors = get_render_errors(request)
+            if errors:
+                self.send_json(400, {'error': 'Invalid request.', 'details': errors})
+                return
+            try:
+                pdf, cache_state = service.render(request)
+            except ValueError as error:
+                self.send_json(400, {'error': str(error)})
+                return
+            except ServiceBusy as error:
+                self.send_json(503, {'error': str(error)})
+                return
+            except Exception as error:
+                # The details stay in the server's output, they may name files of the server
+                print(f"<- SERVER -> ERROR: Render failed: {error}")
+                self.send_json(500, {'error': 'Render failed.'})
+                return
+            service.record(cache_state, time.perf_counter() - start)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/pdf')
+            self.send_header('Content-Length', str(len(pdf)))
+            self.send_header('X-Cache', cache_state.upper())
+            self.end_headers()
+            self.wfile.write(pdf)
+
+        def log_message(self, format, *args):
+            print(f"<- SERVER -> {self.address_string()} {format % args}")
+
+    return RenderHandler
+
+def serve(host='127.0.0.1', port=8080, workers=1, cache_size=256):
+    """
+    Serves CV renders over HTTP until interrupted.
+
+    POST /render takes a JSON request (see RenderService.render) and answers with the PDF, its 'X-Cache' header
+    telling whether it came from the cache. GET /health answers with the cache statistics and the p50/p99 latencies.
+
+    Parameters:
+    host (str): The address to listen on, only the local machine by default.
+    port (int): The port to listen on.
+    workers (int): Number of concurrent renders.
+    cache_size (int): Number of rendered PDFs kept in memory.
+    """
+    service = RenderService(workers, cache_size)
+    server = ThreadingHTTPServer((host, port), create_handler(service))
+    print(f"<- SERVER -> Rendering CVs on http://{host}:{server.server_address[1]} with {workers} worker(s) (Ctrl+C to stop)...")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        service.close()
@@ -0,0 +1,104 @@
+import os
+import uuid
+import base64
+import hashlib
+import tempfile
+
+from email.message import MIMEPart
+from email.policy import SMTP
+
+from Assets import get_file_hash
+
+# Encoded attachment parts, reused when the same CV is sent to several companies
+attachment_folder = os.path.join('cache', 'attachments')
+
+# A multiple of 57 bytes so every chunk encodes into whole 76 characters base64 lines
+chunk_size = 57 * 1024
+
+def get_part_headers(attachment_name):
+    # Built by the email package so any filename (spaces, ';', non-ASCII characters) is quoted or RFC 2231 encoded
+    part = MIMEPart(policy=SMTP)
+    part['Content-Type'] = 'application/octet-stream'
+    part['MIME-Version'] = '1.0'
+    part['Content-Transfer-Encoding'] = 'base64'
+    part.add_header('Content-Disposition', 'attachment', filename=attachment_name)
+    # A part without payload serialises as its headers followed by the blank line ending them
+    return part.as_bytes(policy=SMTP)
+
+def encode_attachment(file_path, attachment_name):
+    """
+    Encodes a file as a base64 MIME part, streaming it from disk chunk by chunk.
+
+    Parameters:
+    file_path (str): The path to the file to attach.
+    attachment_name (str): The filename shown to the recipient.
+
+    Returns:
+    str: The path to the encoded part (headers included, CRLF line endings), cached until the file changes.
+    """
+    # Named after the attached file and its content, so a rebuilt CV replaces the part of its previous content
+    source_key = hashlib.sha256(f"{os.path.abspath(file_path)}|{attachment_name}".encode('utf-8')).hexdigest()
+    part_name = f"{source_key}_{get_file_hash(file_path)}.part"
+    part_path = os.path.join(attachment_folder, part_name)
+    if os.path.exists(part_path):
+        return part_path
+
+    os.makedirs(attachment_folder, exist_ok=True)
+    # Written under a unique temporary name first so concurrent runs and threads never read nor write over a half written part
+    descriptor, temp_path = tempfile.mkstemp(suffix='.tmp', dir=attachment_folder)
+    try:
+        with open(file_path, 'rb') as source, os.fdopen(descriptor, 'wb') as part:
+            part.write(get_part_headers(attachment_name))
+            for chunk in iter(lambda: source.read(chunk_size), b''):
+                part.write(base64.encodebytes(chunk).replace(b"\n", b"\r\n"))
+        os.replace(temp_path, part_path)
+    except BaseException:
+        remove_message(temp_path)
+        raise
+
+    # The parts of the file's previous contents are never used again
+    for entry in os.listdir(attachment_folder):
+        if entry.startswith(f"{source_key}_") and entry.endswith('.part') and entry != part_name:
+            remove_message(os.path.join(attachment_folder, entry))
+    return part_path
+
+def write_message(message, attachments=()):
+    """
+    Writes a multipart message to a temporary file, appending the attachments without loading them in memory.
+
+    Parameters:
+    message (MIMEMultipart): The message headers and inline parts (e.g. the HTML body).
+    attachments (list): (file_path, attachment_name) tuples to attach.
+
+    Returns:
+    str: The path to the RFC 822 message file. The caller removes it once sent.
+    """
+    boundary = message.get_boundary() or f"==============={uuid.uuid4().hex}=="
+    message.set_boundary(boundary)
+    flattened = message.as_bytes(policy=SMTP)
+    closing = f"--{boundary}--".encode('ascii')
+    # Everything up to the closing boundary is small: headers and body, the attachments are then streamed in
+    head = flattened[:flattened.rindex(closing)]
+
+    descriptor, message_path = tempfile.mkstemp(prefix='jobfinder_', suffix='.eml')
+    with os.fdopen(descriptor, 'wb') as output:
+        output.write(head)
+        for file_path, attachment_name in attachments:
+            output.write(f"--{boundary}\r\n".encode('ascii'))
+            with open(encode_attachment(file_path, attachment_name), 'rb') as part:
+                for chunk in iter(lambda: part.read(chunk_size), b''):
+                    output.write(chunk)
+            output.write(b"\r\n")
+        output.write(closing + b"\r\n")
+    return message_path
+
+def read_raw_message(message_path):
+    # Only for the requests that can not upload a file, such as batch requests
+    with open(message_path, 'rb') as message:
+        return base64.urlsafe_b64encode(message.read()).decode()
+
+def remove_message(message_path):
+    try:
+        os.remove(message_path)
+    except OSError:
+        pass
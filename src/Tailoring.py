@@ -0,0 +1,143 @@
+import os
+import re
+import math
+
+from collections import Counter
+from functools import lru_cache
+
+# Words too common in job descriptions to tell the CV items apart
+stop_words = frozenset((
+    'a', 'about', 'all', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'for', 'from', 'have', 'in', 'is', 'it',
+    'of', 'on', 'or', 'our', 'that', 'the', 'their', 'this', 'to', 'we', 'will', 'with', 'you', 'your'
+))
+
+# Keeps technology names such as c++, c# or node.js in one piece
+token_pattern = re.compile(r"[a-z0-9][a-z0-9+#.]*")
+
+def tokenize(text):
+    tokens = []
+    for token in token_pattern.findall(text.lower()):
+        token = token.rstrip('.')
+        # Dotted names also match their parts, e.g. 'react.js' matches 'react'
+        parts = token.split('.') if '.' in token else ()
+        tokens.extend(part for part in (token, *parts) if part and part not in stop_words)
+    return tokens
+
+@lru_cache(maxsize=256)
+def read_job_description(path, modified_time):
+    # The modification time is part of the key so an edited file is read again
+    with open(path, 'r', encoding='utf-8') as file:
+        return file.read()
+
+def get_job_description_path(company):
+    # The file 'jobDescription' points to, None when the description is written in place
+    description = company.get('jobDescription', '')
+    if description and '\n' not in description and len(description) < 260 and os.path.isfile(description):
+        return description
+    return None
+
+def get_job_description(company):
+    """
+    Fetches the job description of a company entry, either written in 'jobDescription' or read from the file it points to.
+
+    Parameters:
+    company (dict): The company entry.
+
+    Returns:
+    str: The job description, empty when the company has none.
+    """
+    path = get_job_description_path(company)
+    if path:
+        return read_job_description(path, os.stat(path).st_mtime_ns)
+    return company.get('jobDescription', '')
+
+def get_item_text(section, item):
+    if section == 'experience':
+        return ' '.join([item.get('title', ''), item.get('team', ''), item.get('company', '')] + item.get('sectors', []) + item.get('technologies', []))
+    description = item.get('description', '')
+    return ' '.join([item.get('title', '')] + (description if isinstance(description, list) else [description]))
+
+def get_content_key(experience, projects, skills):
+    # Names a tailored content by the positions of its experience entries and projects and the names of its skills
+    return f"experience={experience};projects={projects};skills={sorted(skills.items())}"
+
+class KeywordIndex:
+    """
+    TF-IDF inverted index over the experience, projects and skills of the curriculum.
+
+    Built once per run, scoring a job description then only looks up its own words, so it takes well under a
+    millisecond per company whatever the amount of companies.
+    """
+    def __init__(self, data):
+        self.data = data
+        # Every experience entry, project and skill is a document
+        documents = {}
+        for section in ('experience', 'projects'):
+            for position, item in enumerate(data.get(section, [])):
+                documents[(section, position)] = tokenize(get_item_text(section, item))
+        for skill_type, type_skills in data.get('skills', {}).items():
+            for skill in type_skills:
+                documents[('skills', skill)] = tokenize(skill)
+
+        document_frequency = Counter(term for tokens in documents.values() for term in set(tokens))
+        self.postings = {}
+        for document, tokens in documents.items():
+            if not tokens:
+                continue
+            weights = {term: count / len(tokens) * (math.log((1 + len(documents)) / (1 + document_frequency[term])) + 1) for term, count in Counter(tokens).items()}
+            # Normalized so long descriptions don't outrank short but relevant items
+            norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+            for term, weight in weights.items():
+                self.postings.setdefault(term, []).append((document, weight / norm))
+        # Tailored contents already built, companies with the same ranking share the same data
+        self.tailored = {}
+        self.original_key = get_content_key(
+            tuple(range(len(data.get('experience', [])))),
+            tuple(range(len(data.get('projects', [])))),
+            {skill_type: tuple(type_skills) for skill_type, type_skills in data.get('skills', {}).items()}
+        )
+
+    def score(self, job_description):
+        scores = {}
+        for term, count in Counter(tokenize(job_description)).items():
+            for document, weight in self.postings.get(term, ()):
+                scores[document] = scores.get(document, 0.0) + weight * (1 + math.log(count))
+        return scores
+
+    def tailor(self, job_description, limits=None):
+        """
+        Reorders the experience, projects and skills by relevance to a job description, most relevant first,
+        keeping only the best ones when limits are configured.
+
+        Parameters:
+        job_description (str): The job description of the company.
+        limits (dict): The optional 'maxExperience', 'maxProjects' and 'maxSkills' (per skill type) of the 'tailoring' settings.
+
+        Returns:
+        tuple: A key naming the tailored content, empty when it is the same as the original, and the tailored data.
+        """
+        limits = limits or {}
+        scores = self.score(job_description)
+
+        def rank(section, keys, limit): # Items of equal relevance keep their configured order
+            ranked = sorted(range(len(keys)), key=lambda position: -scores.get((section, keys[position]), 0.0))
+            return tuple(ranked[:limit] if limit else ranked)
+
+        experience = rank('experience', range(len(self.data.get('experience', []))), limits.get('maxExperience'))
+        projects = rank('projects', range(len(self.data.get('projects', []))), limits.get('maxProjects'))
+        skills = {}
+        for skill_type, type_skills in self.data.get('skills', {}).items():
+            names = list(type_skills)
+            skills[skill_type] = tuple(names[position] for position in rank('skills', names, limits.get('maxSkills')))
+
+        key = get_content_key(experience, projects, skills)
+        if key == self.original_key:
+            return '', self.data
+        if key not in self.tailored:
+            self.tailored[key] = {
+                **self.data,
+                'experience': [self.data['experience'][position] for position in experience],
+                'projects': [self.data['projects'][position] for position in projects],
+                'skills': {skill_type: {skill: self.data['skills'][skill_type][skill] for skill in names} for skill_type, names in skills.items()}
+            }
+        return key, self.tailored[key]
@@ -0,0 +1,76 @@
+import inspect
+import pkgutil
+import importlib
+
+import templates
+
+from functools import lru_cache
+from reportlab.lib.pagesizes import A3, A4, letter
+
+# Used when neither the company nor 'curriculum.json' pick one
+defaultTemplate = 'Base'
+defaultPageSize = 'A3'
+defaultOutputProfile = 'print'
+
+pageSizes = {
+    'A4': A4,
+    'letter': letter,
+    'A3': A3
+}
+
+@lru_cache(maxsize=None)
+def get_template_names():
+    # Every module of the templates folder is a template, only the ones actually picked are imported
+    return tuple(sorted(module.name for module in pkgutil.iter_modules(templates.__path__) if not module.ispkg))
+
+@lru_cache(maxsize=None)
+def get_template(name):
+    """
+    Imports a template of the templates folder.
+
+    Parameters:
+    name (str): The template module name, e.g. 'Base'.
+
+    Returns:
+    module: The template, defining at least generate_pdf_from_json.
+    """
+    if name not in get_template_names():
+        raise ValueError(f"Unknown template '{name}', the available templates are: {', '.join(get_template_names())}.")
+    template = importlib.import_module(f"templates.{name}")
+    if not hasattr(template, 'generate_pdf_from_json'):
+        raise ValueError(f"Template '{name}' does not define generate_pdf_from_json.")
+    return template
+
+def is_two_phase(template):
+    # Templates able to render in two phases lay out the CV body a single time, companies then only get their watermark stamped
+    return hasattr(template, 'generate_base_pdf') and hasattr(template, 'stamp_watermark')
+
+@lru_cache(maxsize=None)
+def get_parameters(function):
+    return frozenset(inspect.signature(function).parameters)
+
+def call(template, function_name, *arguments, **options):
+    # Templates written before page sizes and output profiles existed keep working, they only get the options they accept
+    function = getattr(template, function_name)
+    parameters = get_parameters(function)
+    return function(*arguments, **{name: value for name, value in options.items() if name in parameters})
+
+def as_list(value):
+    return value if isinstance(value, list) else [value]
+
+def get_variants(data, company=None):
+    """
+    Lists the layouts a CV is rendered with: every template of the company crossed with every page size of the company,
+    each falling back to the 'template' and 'pageSize' of 'curriculum.json'.
+
+    Parameters:
+    data (dict): The curriculum data.
+    company (dict): The company entry, the company agnostic CV uses the defaults when None.
+
+    Returns:
+    list: The (template, page size) name pairs, without duplicates and in configuration order.
+    """
+    company = company or {}
+    template_names = as_list(company.get('template', data.get('template', defaultTemplate)))
+    page_size_names = as_list(company.get('pageSize', data.get('pageSize', defaultPageSize)))
+    return list(dict.fromkeys((template_name, page_size_name) for template_name in template_names for page_size_name in page_size_names))
@@ -0,0 +1,293 @@
+import os
+import json
+import hashlib
+
+from functools import lru_cache
+
+# Valid configurations are remembered by content hash, so an unchanged 'curriculum.json' is not validated again
+validation_cache_file = os.path.join('cache', 'validation.json')
+
+# Names of the templates.Base output profiles, listed here so validating never imports reportlab
+output_profiles = ('print', 'compact')
+# Names of the TemplateRegistry page sizes
+page_sizes = ('A4', 'letter', 'A3')
+
+# A single name or several, every one of them is rendered
+def one_or_many(schema):
+    return {"oneOf": [schema, {"type": "array", "items": schema, "minItems": 1}]}
+
+# Also used on its own to validate the rows of external company sources one at a time
+company_schema = {
+    "type": "object",
+    "properties": {
+        "logo": {"type": "string"},
+        "email": {"type": "string", "format": "email"},
+        "position": {"type": "string"},
+        "template": one_or_many({"type": "string"}),
+        "pageSize": one_or_many({"enum": list(page_sizes)}),
+        "jobDescription": {"type": "string"}
+    },
+    "required": ["logo", "email", "position"]
+}
+
+schema = {
+    "type": "object",
+    "properties": {
+        "minimumInterval": {"type": "number", "minimum": 0},
+        "maximumInterval": {"type": "number", "minimum": 0},
+        "rateLimit": {
+            "type": "object",
+            "properties": {
+                "perMinute": {"type": "integer", "minimum": 1},
+                "perHour": {"type": "integer", "minimum": 1},
+                "perDay": {"type": "integer", "minimum": 1},
+                "retries": {"type": "integer", "minimum": 0},
+                "backoff": {"type": "number", "exclusiveMinimum": 0},
+                "maximumBackoff": {"type": "number", "exclusiveMinimum": 0}
+            }
+        },
+        "smtp": {
+            "type": "object",
+            "properties": {
+                "host": {"type": "string"},
+                "port": {"type": "integer"},
+                "username": {"type": "string"},
+                "sender": {"type": "string", "format": "email"},
+                "security": {"enum": ["starttls", "ssl", "none"]},
+                "poolSize": {"type": "integer", "minimum": 1}
+            },
+            "required": ["host"]
+        },
+        "batch": {
+            "type": "object",
+            "properties": {
+                "size": {"type": "integer", "minimum": 1, "maximum": 100},
+                "perMinute": {"type": "integer", "minimum": 1}
+            }
+        },
+        "message": {
+            "type": "object",
+            "properties": {
+                "opening": {"type": "array", "items": {"type": "string"}},
+                "constant": {"type": "array", "items": {"type": "string"}},
+                "variable": {"type": "array", "items": {"type": "string"}},
+                "ending": {"type": "array", "items": {"type": "string"}},
+                "subject": {"type": "string"}
+            },
+            "required": ["opening", "constant", "variable", "ending"]
+        },
+        "companies": {
+            "type": "array",
+            "items": company_schema
+        },
+        "companySource": {
+            "oneOf": [
+                {"type": "string"},
+                {
+                    "type": "object",
+                    "properties": {
+                        "path": {"type": "string"},
+                        "table": {"type": "string"}
+                    },
+                    "required": ["path"]
+                }
+            ]
+        },
+        "outputProfile": {"enum": list(output_profiles)},
+        "template": one_or_many({"type": "string"}),
+        "pageSize": one_or_many({"enum": list(page_sizes)}),
+        "tailoring": {
+            "type": "object",
+            "properties": {
+                "maxExperience": {"type": "integer", "minimum": 1},
+                "maxProjects": {"type": "integer", "minimum": 1},
+                "maxSkills": {"type": "integer", "minimum": 1}
+            }
+        },
+        "avatar": {"type": "string"},
+        "name": {"type": "string"},
+        "title": {"type": "string"},
+        "about": {"type": "array", "items": {"type": "string"}},
+        "contact": {
+            "type": "object",
+            "properties": {
+                "address": {"type": "string"},
+                "phone": {"type": "string"},
+                "email": {"type": "string", "format": "email"},
+                "linkedin": {"type": "string", "format": "uri"},
+                "github": {"type": "string", "format": "uri"}
+            },
+            "required": ["address", "phone", "email", "linkedin", "github"]
+        },
+        "experience": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "team": {"type": "string"},
+                    "company": {"type": "string"},
+                    "date": {"type": "string"},
+                    "sectors": {"type": "array", "items": {"type": "string"}},
+                    "technologies": {"type": "array", "items": {"type": "string"}}
+                },
+                "required": ["title", "team", "company", "date", "sectors", "technologies"]
+            }
+        },
+        "education": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "degree": {"type": "string"},
+                    "institution": {"type": "string"},
+                    "date": {"type": "string"}
+                },
+                "required": ["degree", "institution", "date"]
+            }
+        },
+        "certificates": {
+            "type": "array", 
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "authority": {"type": "string"},
+                    "date": {"type": "string"}
+                },
+                "required": ["name", "authority", "date"]
+            }
+        },
+        "projects": {
+            "type": "array", 
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "description": {
+                        "oneOf": [
+                            {   
+                                "type": "string"
+                            },
+                            {
+                                "type": "array",
+                                "items": {"type": "string"}
+                            }
+                        ]
+                    }
+                },
+                "required": ["title", "description"]
+            }
+        },
+        "skills": {
+            "type": "object",
+            "properties": {
+                "Technical": {
+                    "type": "object",
+                    "additionalProperties": {
+                        "type": "integer"
+                    }
+                },
+                "Leadership and Management": {
+                    "type": "object",
+                    "additionalProperties": {
+                        "type": "integer"
+                    }
+                },
+                "Soft": {
+                    "type": "object",
+                    "additionalProperties": {
+                        "type": "integer"
+                    }
+                }
+            }
+        },
+        "languages": {
+            "type": "object",
+            "additionalProperties": {
+                "type": "integer"
+            }
+        }
+    },
+    "required": ["message", "avatar", "name", "title", "about", "contact"],
+    "anyOf": [
+        {"required": ["companies"]},
+        {"required": ["companySource"]}
+    ]
+}
+
+# What a single render of the 'serve' command needs: the CV content, without the email settings nor the company list
+render_schema = {
+    "type": "object",
+    "properties": {
+        "curriculum": {
+            "type": "object",
+            "properties": {key: value for key, value in schema["properties"].items() if key not in ('minimumInterval', 'maximumInterval', 'rateLimit', 'smtp', 'batch', 'message', 'companies', 'companySource')},
+            "required": ["avatar", "name", "title", "about", "contact"]
+        },
+        "company": {
+            "type": "object",
+            "properties": company_schema["properties"]
+        },
+        "outputProfile": {"enum": list(output_profiles)}
+    },
+    "required": ["curriculum"]
+}
+
+# Part of every content hash, so editing the schema invalidates the cached results
+schema_hash = hashlib.sha256(json.dumps(schema, sort_keys=True).encode('utf-8')).hexdigest()
+
+@lru_cache(maxsize=None)
+def get_validator():
+    # Built once and only when needed, importing jsonschema is the slowest part of validating
+    from jsonschema import Draft7Validator
+    return Draft7Validator(schema)
+
+@lru_cache(maxsize=None)
+def get_company_validator():
+    from jsonschema import Draft7Validator
+    return Draft7Validator(company_schema)
+
+@lru_cache(maxsize=None)
+def get_render_validator():
+    from jsonschema import Draft7Validator
+    return Draft7Validator(render_schema)
+
+def get_render_errors(request):
+    return [f"{'/'.join(str(part) for part in error.absolute_path) or 'request'}: {error.message}" for error in get_render_validator().iter_errors(request)]
+
+def get_company_errors(company):
+    return [f"{'/'.join(str(part) for part in error.absolute_path) or 'row'}: {error.message}" for error in get_company_validator().iter_errors(company)]
+
+def get_content_hash(content):
+    return hashlib.sha256(schema_hash.encode('utf-8') + content).hexdigest()
+
+def get_errors(data):
+    """
+    Validates the data against the schema in a single pass.
+
+    Parameters:
+    data (dict): The parsed 'curriculum.json' data.
+
+    Returns:
+    list: Every validation error as a 'path: message' string, empty when the data is valid.
+    """
+    errors = sorted(get_validator().iter_errors(data), key=lambda error: [str(part) for part in error.absolute_path])
+    return [f"{'/'.join(str(part) for part in error.absolute_path) or '(root)'}: {error.message}" for error in errors]
+
+def load_validation_cache():
+    try:
+        with open(validation_cache_file, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def is_known_valid(content_hash):
+    return load_validation_cache().get('valid') == content_hash
+
+def remember_valid(content_hash):
+    os.makedirs(os.path.dirname(validation_cache_file), exist_ok=True)
+    temp_file = f"{validation_cache_file}.{os.getpid()}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as file:
+        json.dump({'valid': content_hash}, file)
+    os.replace(temp_file, validation_cache_file)
@@ -0,0 +1,159 @@
+import os
+import json
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+from GenerateCV import generate_cv_for_companies
+from CompanySource import iter_companies, get_source_settings
+from Tailoring import get_job_description_path
+from Validation import get_errors, get_content_hash, is_known_valid, remember_valid
+
+logo_folder = 'logos'
+
+def get_watched_files(data_path, data, shard=None):
+    # Every file a CV is built from, besides the logos folder which is scanned as a whole
+    files = [data_path]
+    if data.get('avatar'):
+        files.append(data['avatar'])
+    company_source = data.get('companySource')
+    if company_source:
+        files.append(get_source_settings(company_source)[0])
+    # The job descriptions of the companies built, inline or read from the company source, each file once
+    try:
+        job_descriptions = {get_job_description_path(company) for company in iter_companies(data, shard, report=False)}
+    except Exception:
+        # The build reports the unreadable source, its job descriptions are watched once it changes and can be read
+        job_descriptions = set()
+    files.extend(sorted(path for path in job_descriptions if path))
+    return files
+
+def take_snapshot(files):
+    """
+    Records the modification time and size of the watched files and of every file of the logos folder.
+
+    Parameters:
+    files (list): The files returned by get_watched_files.
+
+    Returns:
+    dict: The (modification time, size) of every path, None for the watched files that don't exist.
+    """
+    snapshot = {}
+    for path in files:
+        try:
+            stat = os.stat(path)
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            snapshot[path] = None
+    try:
+        with os.scandir(logo_folder) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        pass
+    return snapshot
+
+def load_valid_data(data_path, company_source=None):
+    # Invalid data is reported and ignored, the watcher keeps running until the file is fixed
+    try:
+        with open(data_path, 'rb') as file:
+            content = file.read()
+        data = json.loads(content.decode('utf-8'))
+    except Exception as error:
+        print(f"<- WATCHER -> Could not read '{data_path}': {error}")
+        return None
+    content_hash = None if company_source else get_content_hash(content)
+    if company_source:
+        data['companySource'] = company_source
+    if content_hash and is_known_valid(content_hash):
+        return data
+    errors = get_errors(data)
+    if errors:
+        print(f"<- WATCHER -> '{data_path}' has {len(errors)} error(s), waiting for them to be fixed:")
+        for error in errors:
+            print(f"\t{error}")
+        return None
+    if content_hash:
+        remember_valid(content_hash)
+    return data
+
+def wait_for_changes(files, snapshot, interval, debounce):
+    """
+    Polls the watched files until they change and stay unchanged for the debounce delay, so a burst of edits
+    (an editor saving several times, a folder of logos being copied) only triggers a single build.
+
+    Parameters:
+    files (list): The files returned by get_watched_files.
+    snapshot (dict): The snapshot the changes are looked for against.
+    interval (float): Seconds between two polls.
+    debounce (float): Seconds the files must stay unchanged before building.
+
+    Returns:
+    tuple: The new snapshot and the changed paths.
+    """
+    current = snapshot
+    while current == snapshot:
+        time.sleep(interval)
+        current = take_snapshot(files)
+    while True:
+        time.sleep(debounce)
+        settled = take_snapshot(files)
+        if settled == current:
+            break
+        current = settled
+    changed = sorted(path for path in set(snapshot) | set(current) if snapshot.get(path) != current.get(path))
+    return current, changed
+
+def watch_curriculum(data_path, data, pdf_folder='output', workers=1, force=False, profile=False, shard=None, output_profile=None, company_source=None, interval=1.0, debounce=0.5):
+    """
+    Builds the CVs and then keeps rebuilding them whenever the curriculum data, the avatar, the company source or a
+    logo changes, until interrupted.
+
+    The process stays alive between builds, so the imports, the compiled validator, the templates and their caches stay
+    warm, and the build manifest limits every rebuild to the CVs whose inputs changed.
+
+    Parameters:
+    data_path (str): The path to the curriculum data, reloaded when it changes.
+    data (dict): The already validated curriculum data.
+    pdf_folder (str): The folder the CVs are written to.
+    workers (int): Number of processes rendering the CVs, kept for the whole session.
+    force (bool): Whether the first build renders every CV again.
+    profile (bool): Whether the first build is profiled.
+    shard (tuple): The (index, count) of the companies to build, None for all of them.
+    output_profile (str): The output profile given on the command line, None for the configured one.
+    company_source (str): The company source given on the command line, overriding the one of the data.
+    interval (float): Seconds between two polls.
+    debounce (float): Seconds the files must stay unchanged before building.
+    """
+    with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as executor:
+        def build(force=False, profile=False):
+            start = time.perf_counter()
+            try:
+                generate_cv_for_companies(data, pdf_folder, workers, force, profile, shard, output_profile, executor)
+            except Exception as error:
+                # A failed build never stops the watcher, the next change gets another chance
+                print(f"<- WATCHER -> Build failed: {error}")
+            print(f"<- WATCHER -> Build finished in {time.perf_counter() - start:.2f}s.")
+
+        build(force, profile)
+        files = get_watched_files(data_path, data, shard)
+        snapshot = take_snapshot(files)
+        print(f"<- WATCHER -> Watching '{data_path}', the avatar and the '{logo_folder}' folder for changes (Ctrl+C to stop)...")
+        while True:
+            snapshot, changed = wait_for_changes(files, snapshot, interval, debounce)
+            print(f"<- WATCHER -> {len(changed)} file(s) changed: {', '.join(changed[:5])}{'...' if len(changed) > 5 else ''}")
+            if data_path in changed:
+                new_data = load_valid_data(data_path, company_source)
+                if new_data is None:
+                    continue
+                data = new_data
+            # The avatar, company source or job descriptions may have changed along with the data, the company source's rows
+            # may point to other job descriptions
+            source = data.get('companySource')
+            if data_path in changed or source and get_source_settings(source)[0] in changed:
+                files = get_watched_files(data_path, data, shard)
+                snapshot = take_snapshot(files)
+            build()
@@ -1,80 +1,204 @@
+import io
 import os
 import uuid
+import tempfile
+import threading
+import Metrics
+from functools import lru_cache
+from collections import OrderedDict
+from pypdf import PdfReader, PdfWriter
 from PIL import Image as PILImage
+from Assets import get_cached_image
+from reportlab import rl_config
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter, A4, A3
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.styles import ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas as pdfcanvas
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Frame, FrameBreak, PageTemplate, Image
 
-def generate_pdf_from_json(output_pdf, data, company_logo=''):
-
-    def halve(number):
-        return number/2
-
-    def ensure_directory_exists(directory):
-        if not os.path.exists(directory):
-            os.makedirs(directory)
-
-    def get_unique_filename(filename):
-        directory = os.path.dirname(filename)
-        base, ext = os.path.splitext(filename)
-        ensure_directory_exists(directory)
-        while True:
-            try:
-                with open(filename, 'x'):
-                    return filename
-            except (FileExistsError, PermissionError):
-                new_guid = uuid.uuid4().hex
-                filename = f"{base}_{new_guid}{ext}"
-
-    # Draw the background on the document (including a custom watermark)
-    def draw_background(canvas, document):
-        canvas.saveState()
-
-        # Draw Grey Rectangle Background on Left Frame
-        canvas.setFillColorRGB(0.91, 0.91, 0.91)
-        rectangleX = document.leftMargin - docMiddleMargin
-        rectangleY = document.bottomMargin
-        rectangleWidth =  halve(document.width) + docMiddleMargin
-        rectangleHeight = document.height
-        canvas.rect(rectangleX, rectangleY, rectangleWidth, rectangleHeight, fill=True, stroke=False)
-        
-        # Draw White Circular Background to whiten out the Left Frame
-        canvas.setFillColorRGB(1, 1, 1)
-        circleX = document.leftMargin + halve(halve(document.width))
-        circleY = document.height + 200
-        circuleRadius = 255
-        canvas.circle(circleX, circleY, circuleRadius, fill=True, stroke=False)
-
-        # Draw Company Logo if exists
-        if company_logo:
-            # Create transparent image with 10% opacity
-            transparent_logo_path = create_transparent_image(company_logo, 0.1)  
-            watermark = Image(transparent_logo_path)
-            img_width = min(watermark.drawWidth, round(halve(frameWidth),0))
-            img_height = round(watermark.drawHeight * (img_width / watermark.drawWidth),0)
-            img_x = document.width-halve(frameWidth-halve(img_width)-docMiddleMargin)
-            img_y = halve(frameWidth)
-            canvas.drawImage(transparent_logo_path, img_x, img_y, img_width, img_height, mask='auto')
-            # Clean up the temporary file
-            os.remove(transparent_logo_path)
-            print(f"<- CV GENERATOR ->  Watermark applied for {os.path.split(os.path.splitext(company_logo)[0])[1]}.")
-
-        canvas.restoreState()
-
-    # Create a transparent image with given opacity
-    def create_transparent_image(image_path, opacity):
-        image = PILImage.open(image_path).convert("RGBA")
-        alpha = image.split()[3]
-        alpha = alpha.point(lambda p: p * opacity)
-        image.putalpha(alpha)
-        temp_image_path = f"temp_{os.path.basename(image_path)}"
-        image.save(temp_image_path)
-        return temp_image_path
-
+# Bump whenever the layout changes so previously built CVs are rendered again
+templateVersion = '1'
+
+# Page geometry shared by the full render and the watermark overlay, the page size can be picked per company
+pageSize = A3
+docMargin = inch
+docMiddleMargin = 6
+# Resolution images are resampled to, enough for a sharp print without embedding oversized sources
+printDpi = 150
+
+# 'print' keeps images sharp enough for paper, 'compact' downsamples them for smaller email attachments
+outputProfiles = {
+    'print': {'dpi': printDpi, 'jpegQuality': 85},
+    'compact': {'dpi': 96, 'jpegQuality': 70}
+}
+defaultOutputProfile = 'print'
+
+# Streams are written as raw binary, the default ASCII85 text is a quarter bigger and only needed by 7-bit transports
+rl_config.useA85 = 0
+
+def halve(number):
+    return number/2
+
+def ensure_directory_exists(directory):
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+def write_output(output_pdf, write):
+    """
+    Writes a PDF to a temporary file of its folder and moves it onto its name, so every rebuild keeps the same name and
+    readers never see a half written file.
+
+    Parameters:
+    output_pdf (str): The path of the PDF.
+    write (callable): Writes the PDF to the path it is given.
+
+    Returns:
+    str: The path written, with a GUID suffixed when the existing PDF can't be replaced (e.g. open in a viewer).
+    """
+    directory = os.path.dirname(output_pdf)
+    ensure_directory_exists(directory)
+    file_descriptor, temp_path = tempfile.mkstemp(suffix='.tmp', dir=directory or '.')
+    os.close(file_descriptor)
+    try:
+        write(temp_path)
+        try:
+            os.replace(temp_path, output_pdf)
+        except PermissionError:
+            base, ext = os.path.splitext(output_pdf)
+            output_pdf = f"{base}_{uuid.uuid4().hex}{ext}"
+            os.replace(temp_path, output_pdf)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return output_pdf
+
+def get_modified_time(image_path):
+    return os.stat(image_path).st_mtime_ns
+
+# Create a transparent image with given opacity.
+# Kept in memory and memoized so every page and every company sharing a logo reuses the same image.
+# The modification time is part of the key so an image edited while the process runs (e.g. in watch mode) is read again.
+@lru_cache(maxsize=64)
+def create_transparent_image(image_path, opacity, modified_time=None):
+    image = PILImage.open(image_path).convert("RGBA")
+    alpha = image.split()[3]
+    # Lookup table instead of a per pixel python function
+    alpha = alpha.point([round(value * opacity) for value in range(256)])
+    image.putalpha(alpha)
+    return ImageReader(image)
+
+@lru_cache(maxsize=64)
+def get_image_size(image_path, modified_time=None):
+    # Only reads the image header
+    with PILImage.open(image_path) as image:
+        return image.size
+
+# Draw the company logo as a watermark on the right frame of the page
+def draw_watermark(canvas, document_width, frame_width, company_logo, output_profile=defaultOutputProfile):
+    logo_width, logo_height = get_image_size(company_logo, get_modified_time(company_logo))
+    img_width = min(logo_width, round(halve(frame_width),0))
+    img_height = round(logo_height * (img_width / logo_width),0)
+    img_x = document_width-halve(frame_width-halve(img_width)-docMiddleMargin)
+    img_y = halve(frame_width)
+    with Metrics.span('watermark'):
+        # Create transparent image with 10% opacity from the logo already resized to its printed size
+        profile = outputProfiles[output_profile]
+        logo_path = get_cached_image(company_logo, img_width, img_height, profile['dpi'], profile['jpegQuality'])
+        transparent_logo = create_transparent_image(logo_path, 0.1, get_modified_time(logo_path))
+        canvas.drawImage(transparent_logo, img_x, img_y, img_width, img_height, mask='auto')
+    print(f"<- CV GENERATOR ->  Watermark applied for {os.path.split(os.path.splitext(company_logo)[0])[1]}.")
+
+def report_pdf_size(output_pdf, output_profile):
+    # Printed for every output so the effect of the profile on the attachment sizes can be followed
+    size = os.path.getsize(output_pdf)
+    print(f"<- CV GENERATOR ->  {os.path.basename(output_pdf)}: {size / 1024:.1f} KB ({output_profile} profile).")
+
+def generate_pdf_from_json(output_pdf, data, company_logo='', output_profile=defaultOutputProfile, page_size=pageSize):
+    """
+    Renders the full curriculum, watermark included, into a new PDF.
+
+    Parameters:
+    output_pdf (str): The output path (a GUID is suffixed if the existing PDF is locked).
+    data (dict): The curriculum data.
+    company_logo (str): The path to the company logo drawn as a watermark, none when empty.
+    output_profile (str): One of the outputProfiles, 'compact' for smaller email attachments.
+    page_size (tuple): The (width, height) of the pages in points, e.g. reportlab's A4.
+
+    Returns:
+    str: The path the PDF was written to.
+    """
+    # Render the full curriculum and move it onto the output name
+    output_pdf = write_output(output_pdf, lambda path: build_curriculum(path, data, company_logo, output_profile, page_size))
+    report_pdf_size(output_pdf, output_profile)
+    return output_pdf
+
+def generate_base_pdf(data, output_profile=defaultOutputProfile, page_size=pageSize):
+    """
+    Lays out the company agnostic curriculum once, so it can be stamped for every company.
+
+    Parameters:
+    data (dict): The curriculum data.
+    output_profile (str): One of the outputProfiles.
+    page_size (tuple): The (width, height) of the pages in points.
+
+    Returns:
+    bytes: The rendered PDF without any watermark.
+    """
+    buffer = io.BytesIO()
+    build_curriculum(buffer, data, output_profile=output_profile, page_size=page_size)
+    return buffer.getvalue()
+
+def stamp_watermark(base_pdf, output_pdf, company_logo, output_profile=defaultOutputProfile, page_size=pageSize):
+    """
+    Overlays the company watermark underneath every page of an already rendered curriculum.
+
+    Parameters:
+    base_pdf (bytes): The PDF returned by generate_base_pdf.
+    output_pdf (str): The output path (a GUID is suffixed if the existing PDF is locked).
+    company_logo (str): The path to the company logo, the base PDF is written as is when empty.
+    output_profile (str): The profile the base PDF was rendered with.
+    page_size (tuple): The page size the base PDF was rendered with.
+
+    Returns:
+    str: The path the stamped PDF was written to.
+    """
+    if not company_logo:
+        def write(path): # The base PDF as is
+            with open(path, 'wb') as file:
+                file.write(base_pdf)
+        output_pdf = write_output(output_pdf, write)
+        report_pdf_size(output_pdf, output_profile)
+        return output_pdf
+
+    document_width = page_size[0] - 2*docMargin
+    frame_width = halve(document_width) - docMiddleMargin
+
+    # The watermark layer is a single blank page holding only the logo
+    watermark_buffer = io.BytesIO()
+    watermark_canvas = pdfcanvas.Canvas(watermark_buffer, pagesize=page_size, pageCompression=1)
+    draw_watermark(watermark_canvas, document_width, frame_width, company_logo, output_profile)
+    watermark_canvas.showPage()
+    watermark_canvas.save()
+    watermark_page = PdfReader(watermark_buffer).pages[0]
+
+    with Metrics.span('stamp'):
+        writer = PdfWriter(clone_from=PdfReader(io.BytesIO(base_pdf)))
+        for page in writer.pages:
+            # Merged underneath so the text keeps being drawn over the logo, as in the full render
+            page.merge_page(watermark_page, over=False)
+            # Merging leaves the page content uncompressed
+            page.compress_content_streams()
+
+        output_pdf = write_output(output_pdf, writer.write)
+    report_pdf_size(output_pdf, output_profile)
+    return output_pdf
+
+@lru_cache(maxsize=None)
+def get_styles():
+    # Built once per process, every render shares the same ParagraphStyle objects
     # Custom css styles
     name_style = ParagraphStyle(
         name='NameStyle',
@@ -167,125 +291,210 @@ def generate_pdf_from_json(output_pdf, data, company_logo=''):
         fontName='Helvetica-Bold'
     )
 
-    # Generate our output file name and sets it as a SimpleDocTemplate
-    output_pdf = get_unique_filename(output_pdf)
-    doc = SimpleDocTemplate(output_pdf, pagesize=A3)
-    styles = getSampleStyleSheet()
-
-    # Array of PDF Elements that compose the CV
-    curriculumVitae = []
-
-    # Create frame for two-column layout
-    docMiddleMargin = 6
-    frameWidth = halve(doc.width) - docMiddleMargin
-    frameLeft = Frame(doc.leftMargin, doc.bottomMargin, frameWidth, doc.height, id='left')
-    frameRight = Frame(doc.leftMargin + halve(doc.width) + docMiddleMargin, doc.bottomMargin, frameWidth, doc.height, id='right')
-    template = PageTemplate(id='twoColumn', frames=[frameLeft, frameRight], onPage=draw_background)
-    doc.addPageTemplates([template])
-
-    # Avatar Section
-    profile_image_path = data.get('avatar', '')
-    if os.path.exists(profile_image_path):
-        avatar = Image(profile_image_path)
-        avatar.hAlign = 'CENTER'
-        # Adjust image width and height as needed
-        img_width = min(avatar.drawWidth, halve(frameWidth))
-        img_height = avatar.drawHeight * (img_width / avatar.drawWidth)
-        avatar.drawWidth = img_width
-        avatar.drawHeight = img_height
-        curriculumVitae.append(avatar)
-        curriculumVitae.append(Spacer(1, 0.1*inch))
-
-    # Name and Title
-    curriculumVitae.append(Paragraph(data.get('name', 'Your Name'), name_style))
-    curriculumVitae.append(Paragraph(data.get('title', 'Your Title'), title_style))
-
-    # Contact Information
-    contact = data.get('contact', {})
-    contact_info = f"<b>Address:</b> {contact.get('address','')}<br/><b>Phone:</b> {contact.get('phone','')}<br/><b>Email:</b> {contact.get('email','')}<br/><b>LinkedIn:</b> {contact.get('linkedin','')}<br/><b>GitHub:</b> {contact.get('github','')}"
-    curriculumVitae.append(Paragraph(contact_info, detail_style))
-
-    # About Me Section
-    about = data.get('about', [])
-    if about:
-        curriculumVitae.append(Paragraph(f"<br/>ABOUT ME", header_style))
-        about_me = ' '.join(about)
-        curriculumVitae.append(Paragraph(about_me, normal_style))
-
-    # Experience Section
-    experience = data.get('experience', [])
-    if experience:
-        curriculumVitae.append(Paragraph(f"<br/>EXPERIENCE", header_style))
-        for item in experience:
-            experience_story = f"<b>{item.get('title', '')} at {item.get('company', '')}'s</b> {item.get('team','')} Team<br/>"
-            curriculumVitae.append(Paragraph(experience_story, detail_style))
-            curriculumVitae.append(Paragraph(f"{item.get('date','')}", minimal_style))
-            if 'sectors' in item:
-                skills = " | ".join(item['sectors'])
-                curriculumVitae.append(Paragraph(skills, wrapped_header_style))
-            if 'technologies' in item:
-                skills = " | ".join(item['technologies'])
-                curriculumVitae.append(Paragraph(skills, wrapped_blue_style))
-            curriculumVitae.append(Spacer(1, 0.1 * inch))
-
-    # END OF LEFT FRAME / START OF RIGHT FRAME
-    curriculumVitae.append(FrameBreak())
-
-    # Education Section
-    education = data.get('education', [])
-    if education:
-        curriculumVitae.append(Paragraph(f"<br/>EDUCATION", header_style))
-        edu_content = [f"<b>{edu.get('degree', '')}</b> from {edu.get('institution', '')} <i>({edu.get('date', '')})</i>" for edu in education]
-        for degree in edu_content:
-            curriculumVitae.append(Paragraph(degree, normal_style))
-            curriculumVitae.append(Spacer(1, 0.1 * inch))
-
-    # Certificates Section
-    certificates = data.get('certificates', [])
-    if certificates:
-        curriculumVitae.append(Paragraph("<br/>CERTIFICATES", header_style))
-        for certificate in certificates:
-            certificate_story = f"<b>{certificate.get('name','Unknown')}</b> by {certificate.get('authority','Unknown')}"           
-            curriculumVitae.append(Paragraph(certificate_story, normal_style))
-            curriculumVitae.append(Paragraph(f"{certificate.get('date','')}", minimal_style))
-
-    # Projects Section
-    projects = data.get('projects', [])
-    if projects:
-        curriculumVitae.append(Paragraph("<br/>PROJECTS", header_style))
-        for project in projects:
-            project_story = f"<b>{project.get('title','')}</b><br/>"
-            if 'description' in project:
-                if isinstance(project['description'], list):
-                    description_list = f"<br/> • ".join(project['description'])
-                    project_story += f" • {description_list}"
-                else:
-                    project_story += f" • {project.get('description')}"
-            curriculumVitae.append(Paragraph(project_story, bulletpoint_style))
-
-    # Skills Section
-    skills = data.get('skills', {})
-    if skills:
-        curriculumVitae.append(Paragraph("<br/>SKILLS", header_style))
-        curriculumVitae.append(Paragraph(f"● = Junior<br/>●● = Intermediate<br/>●●● = Senior<br/>●●●● = Expert<br/>●●●●● = Master", minimal_style))
-        for skill_type, type_skills in skills.items():
-            skill_type_paragraph = Paragraph(f"{skill_type} Skills", header_style)
-            curriculumVitae.append(skill_type_paragraph)
-            for skill, level in type_skills.items():
-                dots = '●' * level
-                skill_paragraph = Paragraph(f"{skill}: {dots}", detail_style)
-                curriculumVitae.append(skill_paragraph)
+    return {
+        'name': name_style,
+        'title': title_style,
+        'header': header_style,
+        'normal': normal_style,
+        'bulletpoint': bulletpoint_style,
+        'detail': detail_style,
+        'minimal': minimal_style,
+        'wrapped_header': wrapped_header_style,
+        'wrapped_blue': wrapped_blue_style
+    }
+
+class CurriculumTemplate:
+    """
+    Reusable two-column curriculum layout.
+
+    Styles are built once per process and the parsed markup of every paragraph is cached by its text and style,
+    so sections that are the same for every render (contact, experience, education, skills...) are only parsed once.
+    """
+    # Parsing doesn't depend on the page size nor the profile, so every template shares the parsed paragraphs
+    paragraph_fragments = OrderedDict()
+    paragraph_cache_size = 4096
+    # Renders may run from several threads sharing the templates
+    lock = threading.Lock()
+
+    def __init__(self, page_size=pageSize, output_profile=defaultOutputProfile):
+        self.page_size = page_size
+        self.output_profile = output_profile
+        self.profile = outputProfiles[output_profile]
+        self.styles = get_styles()
+
+    def paragraph(self, text, style_name):
+        key = (text, style_name)
+        with self.lock:
+            fragments = self.paragraph_fragments.get(key)
+            if fragments is not None:
+                self.paragraph_fragments.move_to_end(key)
+        if fragments is not None:
+            Metrics.increment('paragraph_cache_hits')
+            # A new Paragraph is still created every time, only the parsing is skipped: flowables hold layout state of their own
+            return Paragraph(text, self.styles[style_name], frags=fragments)
+        paragraph = Paragraph(text, self.styles[style_name])
+        with self.lock:
+            self.paragraph_fragments[key] = paragraph.frags
+            if len(self.paragraph_fragments) > self.paragraph_cache_size:
+                self.paragraph_fragments.popitem(last=False)
+        return paragraph
+
+    def build_story(self, data, frame_width):
+        paragraph = self.paragraph
+
+        # Array of PDF Elements that compose the CV
+        curriculumVitae = []
+
+        # Avatar Section
+        profile_image_path = data.get('avatar', '')
+        if os.path.exists(profile_image_path):
+            # Adjust image width and height as needed
+            avatar_width, avatar_height = get_image_size(profile_image_path, get_modified_time(profile_image_path))
+            img_width = min(avatar_width, halve(frame_width))
+            img_height = avatar_height * (img_width / avatar_width)
+            # Embeds the avatar already resized to its printed size instead of the full resolution source
+            avatar = Image(get_cached_image(profile_image_path, img_width, img_height, self.profile['dpi'], self.profile['jpegQuality']), width=img_width, height=img_height)
+            avatar.hAlign = 'CENTER'
+            curriculumVitae.append(avatar)
+            curriculumVitae.append(Spacer(1, 0.1*inch))
+
+        # Name and Title
+        curriculumVitae.append(paragraph(data.get('name', 'Your Name'), 'name'))
+        curriculumVitae.append(paragraph(data.get('title', 'Your Title'), 'title'))
+
+        # Contact Information
+        contact = data.get('contact', {})
+        contact_info = f"<b>Address:</b> {contact.get('address','')}<br/><b>Phone:</b> {contact.get('phone','')}<br/><b>Email:</b> {contact.get('email','')}<br/><b>LinkedIn:</b> {contact.get('linkedin','')}<br/><b>GitHub:</b> {contact.get('github','')}"
+        curriculumVitae.append(paragraph(contact_info, 'detail'))
+
+        # About Me Section
+        about = data.get('about', [])
+        if about:
+            curriculumVitae.append(paragraph(f"<br/>ABOUT ME", 'header'))
+            about_me = ' '.join(about)
+            curriculumVitae.append(paragraph(about_me, 'normal'))
+
+        # Experience Section
+        experience = data.get('experience', [])
+        if experience:
+            curriculumVitae.append(paragraph(f"<br/>EXPERIENCE", 'header'))
+            for item in experience:
+                experience_story = f"<b>{item.get('title', '')} at {item.get('company', '')}'s</b> {item.get('team','')} Team<br/>"
+                curriculumVitae.append(paragraph(experience_story, 'detail'))
+                curriculumVitae.append(paragraph(f"{item.get('date','')}", 'minimal'))
+                if 'sectors' in item:
+                    skills = " | ".join(item['sectors'])
+                    curriculumVitae.append(paragraph(skills, 'wrapped_header'))
+                if 'technologies' in item:
+                    skills = " | ".join(item['technologies'])
+                    curriculumVitae.append(paragraph(skills, 'wrapped_blue'))
+                curriculumVitae.append(Spacer(1, 0.1 * inch))
+
+        # END OF LEFT FRAME / START OF RIGHT FRAME
+        curriculumVitae.append(FrameBreak())
+
+        # Education Section
+        education = data.get('education', [])
+        if education:
+            curriculumVitae.append(paragraph(f"<br/>EDUCATION", 'header'))
+            edu_content = [f"<b>{edu.get('degree', '')}</b> from {edu.get('institution', '')} <i>({edu.get('date', '')})</i>" for edu in education]
+            for degree in edu_content:
+                curriculumVitae.append(paragraph(degree, 'normal'))
+                curriculumVitae.append(Spacer(1, 0.1 * inch))
+
+        # Certificates Section
+        certificates = data.get('certificates', [])
+        if certificates:
+            curriculumVitae.append(paragraph("<br/>CERTIFICATES", 'header'))
+            for certificate in certificates:
+                certificate_story = f"<b>{certificate.get('name','Unknown')}</b> by {certificate.get('authority','Unknown')}"
+                curriculumVitae.append(paragraph(certificate_story, 'normal'))
+                curriculumVitae.append(paragraph(f"{certificate.get('date','')}", 'minimal'))
+
+        # Projects Section
+        projects = data.get('projects', [])
+        if projects:
+            curriculumVitae.append(paragraph("<br/>PROJECTS", 'header'))
+            for project in projects:
+                project_story = f"<b>{project.get('title','')}</b><br/>"
+                if 'description' in project:
+                    if isinstance(project['description'], list):
+                        description_list = f"<br/> • ".join(project['description'])
+                        project_story += f" • {description_list}"
+                    else:
+                        project_story += f" • {project.get('description')}"
+                curriculumVitae.append(paragraph(project_story, 'bulletpoint'))
+
+        # Skills Section
+        skills = data.get('skills', {})
+        if skills:
+            curriculumVitae.append(paragraph("<br/>SKILLS", 'header'))
+            curriculumVitae.append(paragraph(f"● = Junior<br/>●● = Intermediate<br/>●●● = Senior<br/>●●●● = Expert<br/>●●●●● = Master", 'minimal'))
+            for skill_type, type_skills in skills.items():
+                curriculumVitae.append(paragraph(f"{skill_type} Skills", 'header'))
+                for skill, level in type_skills.items():
+                    dots = '●' * level
+                    curriculumVitae.append(paragraph(f"{skill}: {dots}", 'detail'))
+                curriculumVitae.append(Spacer(1, 0.1 * inch))
+
+        # Languages Section
+        languages = data.get('languages', {})
+        if languages:
+            curriculumVitae.append(paragraph("<br/>LANGUAGES", 'header'))
+            curriculumVitae.append(paragraph(f"★ = A1<br/>★★★★★ = C1", 'minimal'))
+            for language, level in languages.items():
+                stars = '★' * level
+                curriculumVitae.append(paragraph(f"{language}: {stars}", 'detail'))
             curriculumVitae.append(Spacer(1, 0.1 * inch))
 
-    # Languages Section
-    languages = data.get('languages', {})
-    if languages:
-        curriculumVitae.append(Paragraph("<br/>LANGUAGES", header_style))
-        curriculumVitae.append(Paragraph(f"★ = A1<br/>★★★★★ = C1", minimal_style))
-        for language, level in languages.items():
-            stars = '★' * level
-            language_paragraph = Paragraph(f"{language}: {stars}", detail_style)
-            curriculumVitae.append(language_paragraph)
-        curriculumVitae.append(Spacer(1, 0.1 * inch))
-
-    doc.build(curriculumVitae)
\ No newline at end of file
+        return curriculumVitae
+
+    def build(self, output, data, company_logo=''):
+        # Sets our output as a SimpleDocTemplate
+        doc = SimpleDocTemplate(output, pagesize=self.page_size, pageCompression=1, leftMargin=docMargin, rightMargin=docMargin, topMargin=docMargin, bottomMargin=docMargin)
+
+        # Create frame for two-column layout
+        frameWidth = halve(doc.width) - docMiddleMargin
+        frameLeft = Frame(doc.leftMargin, doc.bottomMargin, frameWidth, doc.height, id='left')
+        frameRight = Frame(doc.leftMargin + halve(doc.width) + docMiddleMargin, doc.bottomMargin, frameWidth, doc.height, id='right')
+
+        # Draw the background on the document (including a custom watermark)
+        def draw_background(canvas, document):
+            canvas.saveState()
+
+            # Draw Grey Rectangle Background on Left Frame
+            canvas.setFillColorRGB(0.91, 0.91, 0.91)
+            rectangleX = document.leftMargin - docMiddleMargin
+            rectangleY = document.bottomMargin
+            rectangleWidth =  halve(document.width) + docMiddleMargin
+            rectangleHeight = document.height
+            canvas.rect(rectangleX, rectangleY, rectangleWidth, rectangleHeight, fill=True, stroke=False)
+            
+            # Draw White Circular Background to whiten out the Left Frame
+            canvas.setFillColorRGB(1, 1, 1)
+            circleX = document.leftMargin + halve(halve(document.width))
+            circleY = document.height + 200
+            circuleRadius = 255
+            canvas.circle(circleX, circleY, circuleRadius, fill=True, stroke=False)
+
+            # Draw Company Logo if exists
+            if company_logo:
+                draw_watermark(canvas, document.width, frameWidth, company_logo, self.output_profile)
+
+            canvas.restoreState()
+
+        template = PageTemplate(id='twoColumn', frames=[frameLeft, frameRight], onPage=draw_background)
+        doc.addPageTemplates([template])
+
+        with Metrics.span('story'):
+            curriculumVitae = self.build_story(data, frameWidth)
+        with Metrics.span('doc_build'):
+            doc.build(curriculumVitae)
+
+@lru_cache(maxsize=None)
+def get_template(output_profile=defaultOutputProfile, page_size=pageSize):
+    # One template per process, profile and page size, shared by every render so its caches stay warm
+    return CurriculumTemplate(page_size, output_profile)
+
+def build_curriculum(output, data, company_logo='', output_profile=defaultOutputProfile, page_size=pageSize):
+    get_template(output_profile, tuple(page_size)).build(output, data, company_logo)